@@ -0,0 +1,166 @@
+"""
+Benchmark of the insertion of the dramas by the InsertItem pipeline, using a
+SQLite database as a stand-in for MySQL. It compares inserting and committing
+the rows one by one (as done before the rows were buffered) with inserting
+them by batches of MYSQL_BATCH_SIZE rows.
+
+Run it from the Scrapy project directory with :
+
+    python -m benchmarks.bench_insert
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+from twisted.internet import defer
+
+from dramascraper.pipelines import InsertItem
+
+
+class SqlitePool:
+    """
+    Stand-in for the pool of connections to MySQL, running the queries and
+    the interactions synchronously on a SQLite connection
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def runQuery(self, query, *args):
+        return defer.succeed(self.connection.execute(query, *args).fetchall())
+
+    def runInteraction(self, interaction, *args):
+        cursor = self.connection.cursor()
+        try:
+            result = interaction(cursor, *args)
+        except Exception:
+            self.connection.rollback()
+            return defer.fail()
+        self.connection.commit()
+        return defer.succeed(result)
+
+    def close(self):
+        self.connection.close()
+
+
+class SqliteInsertItem(InsertItem):
+    """
+    InsertItem pipeline using the placeholders and the upsert syntax of
+    sqlite3. When a connection is given, the pipeline can also be opened,
+    the pool of connections being replaced by a SqlitePool.
+    """
+    QUERY = "INSERT INTO drama ({}) VALUES ({}) " \
+        "ON CONFLICT(mydramalisturl) DO UPDATE SET {}".format(
+            ", ".join(InsertItem.COLUMNS),
+            ", ".join(["?"] * len(InsertItem.COLUMNS)),
+            ", ".join("{0} = excluded.{0}".format(column)
+                      for column in InsertItem.COLUMNS
+                      if column != "mydramalisturl")
+        )
+
+    def __init__(self, connection=None, **kwargs):
+        super().__init__(**kwargs)
+        self.connection = connection
+
+    def db_connection(self):
+        self.dbpool = SqlitePool(self.connection)
+
+
+def generate_items(nb_items):
+    """
+    Generating items similar to the ones returned by the dramalist spider
+
+    Args:
+        nb_items (int): number of items
+
+    Returns:
+        list: list of items
+    """
+    return [
+        {
+            "name": "Drama {}".format(i),
+            "synopsis": "A synopsis of a few sentences. " * 10,
+            "duration_in_minutes": 60,
+            "nb_episodes": 16,
+            "country_origin": "South Korea",
+            "ratings": 8.5,
+            "ranking": i,
+            "popularity_rank": i,
+            "nb_watchers": 10000,
+            "nb_ratings": 5000,
+            "nb_reviews": 50,
+            "streamed_on": ["Viki", "Netflix"],
+            "genres": ["Romance", "Comedy"],
+            "tags": ["Strong Female Lead", "Office Romance"],
+            "mydramalist_url": "https://mydramalist.com/{}-drama".format(i),
+            "mydramalist_id": i,
+            "screenwriter": ["Screenwriter"],
+            "director": ["Director"],
+            "main_roles": ["Actor 1", "Actor 2"],
+            "support_roles": ["Actor {}".format(j) for j in range(20)],
+            "guest_roles": ["Actor {}".format(j) for j in range(10)],
+        }
+        for i in range(nb_items)
+    ]
+
+
+def connect(directory):
+    """
+    Creating a SQLite database with the drama table
+
+    Args:
+        directory (str): directory of the database file
+
+    Returns:
+        sqlite3.Connection: connection to the database
+    """
+    connection = sqlite3.connect(os.path.join(directory, "drama.sqlite3"))
+    connection.execute("CREATE TABLE drama ({}, UNIQUE (mydramalisturl))"
+                       .format(", ".join(InsertItem.COLUMNS)))
+
+    return connection
+
+
+def run(nb_items=5000, batch_size=500):
+    """
+    Measuring the number of rows inserted per second one by one and by
+    batches
+
+    Args:
+        nb_items (int): number of items to insert
+        batch_size (int): number of rows per batch
+
+    Returns:
+        tuple: rows/sec when inserting one by one and by batches
+    """
+    pipeline = SqliteInsertItem(batch_size=batch_size)
+    rows = [pipeline.get_row(item) for item in generate_items(nb_items)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = connect(directory)
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        for row in rows:
+            cursor.execute(pipeline.QUERY, row)
+            connection.commit()
+        one_by_one = nb_items / (time.perf_counter() - start)
+        connection.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        connection = connect(directory)
+        cursor = connection.cursor()
+        start = time.perf_counter()
+        for i in range(0, nb_items, batch_size):
+            pipeline.insert_rows(cursor, rows[i:i + batch_size])
+            connection.commit()
+        batched = nb_items / (time.perf_counter() - start)
+        connection.close()
+
+    return one_by_one, batched
+
+
+if __name__ == "__main__":
+    one_by_one, batched = run()
+    print("one by one: {:.0f} rows/sec".format(one_by_one))
+    print("by batches: {:.0f} rows/sec".format(batched))
@@ -0,0 +1,61 @@
+"""
+Benchmark of the CPU time spent by DramalistSpider.parse_main_tab on a
+drama's page.
+
+Run it from the Scrapy project directory with :
+
+    python -m benchmarks.bench_parse_main_tab
+"""
+import os
+import time
+
+from scrapy.http import HtmlResponse, Request
+
+from dramascraper.spiders.dramalist import DramalistSpider
+from dramascraper.storage import StagingStore
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+URL = "https://mydramalist.com/9025-nirvana-in-fire"
+
+
+def load_fixture(name):
+    """
+    Reading the body of a stored page
+
+    Args:
+        name (str): file name of the fixture
+
+    Returns:
+        bytes: body of the page
+    """
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+def run(nb_pages=2000):
+    """
+    Parsing the same drama's page several times and measuring the CPU time
+    spent per page. A new response is built for every page so that the cost
+    of building the document is included.
+
+    Args:
+        nb_pages (int): number of pages to parse
+
+    Returns:
+        float: CPU time per page in microseconds
+    """
+    spider = DramalistSpider()
+    spider.staging = StagingStore()
+    body = load_fixture("drama.html")
+    start = time.process_time()
+    for _ in range(nb_pages):
+        response = HtmlResponse(URL, body=body, encoding="utf-8",
+                                request=Request(URL))
+        list(spider.parse_main_tab(response))
+    elapsed = time.process_time() - start
+
+    return elapsed / nb_pages * 1e6
+
+
+if __name__ == "__main__":
+    print("parse_main_tab: {:.1f} us/page".format(run()))
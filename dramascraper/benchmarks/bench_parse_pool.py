@@ -0,0 +1,102 @@
+"""
+Benchmark of the extraction of the fields of a drama's page by the pool of
+worker processes (PARSE_WORKERS setting), compared with their extraction in
+the main process. It reports the pages extracted per second and the CPU time
+spent per page by the main process, which bounds the throughput of a crawl
+as the callbacks all run in the thread of the reactor.
+
+Run it from the Scrapy project directory with :
+
+    python -m benchmarks.bench_parse_pool --workers 16
+"""
+import argparse
+import time
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.bench_parse_main_tab import URL, load_fixture
+from dramascraper import parsing
+from dramascraper.spiders.dramalist import DramalistSpider
+
+
+def run_main_process(body, nb_pages, backend):
+    """
+    Extracting the fields of the same page several times in the main process
+
+    Args:
+        body (bytes): body of the page
+        nb_pages (int): number of pages to extract
+        backend (str): backend building the documents of the pages
+
+    Returns:
+        tuple: pages per second and CPU time of the main process per page in
+        microseconds
+    """
+    spider = DramalistSpider()
+    spider.parser_backend = backend
+    start, start_cpu = time.perf_counter(), time.process_time()
+    for _ in range(nb_pages):
+        spider.extract_main_tab(HtmlResponse(URL, body=body,
+                                             encoding="utf-8"))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+
+    return nb_pages / elapsed, cpu / nb_pages * 1e6
+
+
+def run_pool(body, nb_pages, backend, nb_workers):
+    """
+    Extracting the fields of the same page several times with the pool of
+    worker processes
+
+    Args:
+        body (bytes): body of the page
+        nb_pages (int): number of pages to extract
+        backend (str): backend building the documents of the pages
+        nb_workers (int): number of worker processes
+
+    Returns:
+        tuple: pages per second and CPU time of the main process per page in
+        microseconds
+    """
+    pool = parsing.open_pool(nb_workers, backend)
+    # Starting the workers before measuring
+    futures = [pool.submit(parsing.extract, "main_tab", URL, body, "utf-8",
+                           False) for _ in range(nb_workers)]
+    for future in futures:
+        future.result()
+    start, start_cpu = time.perf_counter(), time.process_time()
+    futures = [pool.submit(parsing.extract, "main_tab", URL, body, "utf-8",
+                           False) for _ in range(nb_pages)]
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    pool.shutdown()
+
+    return nb_pages / elapsed, cpu / nb_pages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the extraction of the fields by the pool of "
+                    "worker processes")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="number of worker processes")
+    parser.add_argument("--pages", type=int, default=2000,
+                        help="number of pages extracted")
+    parser.add_argument("--backend", default="parsel",
+                        help="backend building the documents of the pages")
+    args = parser.parse_args()
+
+    body = load_fixture("drama.html")
+    print("{:<16} {:>10} {:>16}".format("", "pages/s", "main CPU us/page"))
+    print("{:<16} {:>10.0f} {:>16.1f}".format(
+        "main process", *run_main_process(body, args.pages, args.backend)))
+    print("{:<16} {:>10.0f} {:>16.1f}".format(
+        "{} workers".format(args.workers),
+        *run_pool(body, args.pages, args.backend, args.workers)))
+
+
+if __name__ == "__main__":
+    main()
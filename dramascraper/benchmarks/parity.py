@@ -0,0 +1,170 @@
+"""
+Checking that the backends building the documents of the responses (see the
+PARSER_BACKEND setting) give the same results : every page is fed through
+the callback of the spiders with each backend, and the items and requests
+produced are compared.
+
+The pages are the stored ones (located in benchmarks/fixtures) and, when a
+directory of the HTTP cache is given, every response recorded by the
+ReplayCacheStorage, the callback being chosen from the url of the page.
+
+Run it from the Scrapy project directory with :
+
+    python -m benchmarks.parity
+    python -m benchmarks.parity --cache .scrapy/httpcache
+
+The run fails when a page gives different results.
+"""
+import argparse
+import gzip
+import sys
+from urllib.parse import urlsplit
+
+import scrapy
+from scrapy.http import Headers, HtmlResponse, Request
+from scrapy.responsetypes import responsetypes
+
+from benchmarks.bench_parse_main_tab import load_fixture
+from benchmarks.suite import DRAMA_URL, LIST_URL, TOP_URL
+from dramascraper import markup
+from dramascraper.middlewares import ENDPOINTS
+from dramascraper.replay import ReplayIndex
+from dramascraper.spiders.dramalist import DramalistSpider
+from dramascraper.spiders.userdramalist import UserdramalistSpider
+from dramascraper.storage import StagingStore
+
+BASE_URL = "https://mydramalist.com"
+FIXTURES = [
+    ("top", TOP_URL, "top.html"),
+    ("drama", DRAMA_URL, "drama.html"),
+    ("cast", DRAMA_URL + "/cast", "cast.html"),
+    ("dramalist", LIST_URL, "userlist.html"),
+]
+
+
+def get_endpoint(url):
+    """
+    Retrieving the class of a page from its url
+
+    Args:
+        url (str): url of the page
+
+    Returns:
+        str: class of the page ('top', 'cast', 'dramalist' or 'drama').
+        Equals to None if no callback parses it.
+    """
+    path = urlsplit(url).path
+    for endpoint, pattern in ENDPOINTS:
+        if pattern.match(path):
+            return endpoint
+    return None
+
+
+def run_callback(endpoint, response, backend):
+    """
+    Feeding a page through the callback of its class with a backend
+
+    Args:
+        endpoint (str): class of the page
+        response (scrapy.http.response): page
+        backend (str): backend building the document of the page
+
+    Returns:
+        list: items produced, and url and staged information of the requests
+        produced. Equals to the name and message of the exception when the
+        callback fails.
+    """
+    if endpoint == "dramalist":
+        spider = UserdramalistSpider(users="parity")
+        spider.pending["parity"] = []
+        meta = {"user": "parity", "status": "completed"}
+        callback = spider.parse
+    else:
+        spider = DramalistSpider()
+        spider.staging = StagingStore()
+        drama_url = response.url[:-len("/cast")] \
+            if endpoint == "cast" else response.url
+        meta = {"page": 1, "entry": (drama_url, None)}
+        if endpoint == "cast":
+            spider.staging.put(drama_url, {"mydramalist_url": drama_url})
+            meta["staging_key"] = drama_url
+        callback = {
+            "top": spider.scrap,
+            "drama": spider.parse_main_tab,
+            "cast": spider.get_cast_members,
+        }[endpoint]
+    spider.parser_backend = backend
+    response = response.replace(request=Request(response.url, meta=meta))
+    results = []
+    try:
+        for result in callback(response):
+            if isinstance(result, scrapy.Request):
+                key = result.meta.get("staging_key")
+                result = (result.url, spider.staging.pop(key)
+                          if key is not None else None)
+            results.append(result)
+    except Exception as e:
+        return ["{}: {}".format(type(e).__name__, e)]
+
+    return results
+
+
+def iter_pages(cachedir=None):
+    """
+    Reading the pages checked
+
+    Args:
+        cachedir (str): directory of the HTTP cache holding the responses
+        recorded by the ReplayCacheStorage
+
+    Yields:
+        tuple: class of the page and response
+    """
+    for endpoint, url, name in FIXTURES:
+        yield endpoint, HtmlResponse(url, body=load_fixture(name),
+                                     encoding="utf-8")
+    if cachedir is None:
+        return
+    index = ReplayIndex(cachedir)
+    for key, (status, headers, path) in sorted(index.responses.items()):
+        url = BASE_URL + key
+        endpoint = get_endpoint(url)
+        if endpoint is None or status != 200:
+            continue
+        with gzip.open(path, "rb") as f:
+            body = f.read()
+        headers = Headers(headers)
+        respcls = responsetypes.from_args(headers=headers, url=url,
+                                          body=body)
+        if issubclass(respcls, HtmlResponse):
+            yield endpoint, respcls(url=url, headers=headers, status=status,
+                                    body=body)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that the parser backends give the same results")
+    parser.add_argument("--cache", metavar="DIRECTORY",
+                        help="directory of the HTTP cache holding recorded "
+                             "responses")
+    args = parser.parse_args()
+
+    reference = markup.BACKENDS[0]
+    nb_pages = 0
+    mismatches = 0
+    for endpoint, response in iter_pages(args.cache):
+        nb_pages += 1
+        expected = run_callback(endpoint, response, reference)
+        for backend in markup.BACKENDS[1:]:
+            results = run_callback(endpoint, response, backend)
+            if results != expected:
+                mismatches += 1
+                print("MISMATCH {} ({}): {} != {}".format(
+                    response.url, backend, results, expected))
+    print("{} pages checked, {} mismatches".format(nb_pages, mismatches))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
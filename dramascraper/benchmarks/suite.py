@@ -0,0 +1,325 @@
+"""
+Benchmark suite feeding the stored pages (located in benchmarks/fixtures)
+through the callbacks of the spiders and the items through the InsertItem
+pipeline, with a SQLite database as a stand-in for MySQL. The callbacks are
+run with each backend building the documents of the pages (see the
+PARSER_BACKEND setting), the cases of the 'lxml' backend being suffixed with
+[lxml].
+
+For each case, it reports the time spent per page (or per item for the
+pipeline), the number of items (or requests) produced per second, the peak
+of the memory allocated by Python while processing the pages and the peak
+resident memory of the process so far. The results can be saved as a
+baseline and compared with it, the run failing when a case is slower or
+allocates more than the baseline beyond a threshold. As the times depend on
+the machine, a baseline is only compared with the results of the machine it
+was saved on, and is not part of the repository.
+
+Run it from the Scrapy project directory with :
+
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --compare benchmarks/baseline.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from scrapy.http import HtmlResponse, Request
+
+from benchmarks.bench_insert import SqliteInsertItem, connect, generate_items
+from benchmarks.bench_parse_main_tab import load_fixture
+from dramascraper import markup
+from dramascraper.spiders.dramalist import DramalistSpider
+from dramascraper.spiders.userdramalist import UserdramalistSpider
+from dramascraper.storage import StagingStore, fingerprint
+
+TOP_URL = "https://mydramalist.com/shows/top?page=1"
+DRAMA_URL = "https://mydramalist.com/9025-nirvana-in-fire"
+LIST_URL = "https://mydramalist.com/dramalist/bench/completed"
+# Metrics compared with the baseline
+COMPARED_METRICS = ("us_per_unit", "peak_alloc_kb")
+
+
+def callback_case(callback, url, body, meta=None):
+    """
+    Building a case parsing the same page several times with a callback. A
+    new response is built for every page so that the cost of building the
+    document is included.
+
+    Args:
+        callback (callable): callback of a spider
+        url (str): url of the page
+        body (bytes): body of the page
+        meta (callable): function returning the meta of the request made to
+        the page (a new one for every page, as the callbacks can alter it)
+
+    Returns:
+        callable: function parsing a number of pages and returning the number
+        of items and requests produced
+    """
+    def run(nb_units):
+        nb_results = 0
+        for _ in range(nb_units):
+            request = Request(url, meta=meta() if meta else None)
+            response = HtmlResponse(url, body=body, encoding="utf-8",
+                                    request=request)
+            for _ in callback(response) or []:
+                nb_results += 1
+        return nb_results
+
+    return run
+
+
+def insert_case(items):
+    """
+    Building a case pushing items through the InsertItem pipeline, from its
+    opening to its closing
+
+    Args:
+        items (list): items to insert (one per unit)
+
+    Returns:
+        callable: function inserting a number of items and returning it
+    """
+    spider = DramalistSpider(sql="true")
+
+    def run(nb_units):
+        with tempfile.TemporaryDirectory() as directory:
+            pipeline = SqliteInsertItem(connection=connect(directory))
+            pipeline.open_spider(spider)
+            for item in items[:nb_units]:
+                pipeline.process_item(item, spider)
+            pipeline.close_spider(spider)
+        return nb_units
+
+    return run
+
+
+def get_cases(nb_items):
+    """
+    Building the benchmarked cases
+
+    Args:
+        nb_items (int): number of items pushed through the pipeline
+
+    Returns:
+        dict: function running each case, by name
+    """
+    cases = {}
+    for backend in markup.BACKENDS:
+        # The cases of the default backend keep their name
+        suffix = "" if backend == "parsel" else "[{}]".format(backend)
+        for name, case in callback_cases(backend).items():
+            cases[name + suffix] = case
+    cases["InsertItem.process_item"] = insert_case(generate_items(nb_items))
+
+    return cases
+
+
+def callback_cases(backend):
+    """
+    Building the cases of the callbacks of the spiders
+
+    Args:
+        backend (str): backend building the documents of the pages
+
+    Returns:
+        dict: function running each case, by name
+    """
+    dramalist = DramalistSpider()
+    dramalist.staging = StagingStore()
+    dramalist.parser_backend = backend
+    userdramalist = UserdramalistSpider(users="bench")
+    userdramalist.parser_backend = backend
+    next(dramalist.parse_main_tab(HtmlResponse(
+        DRAMA_URL, body=load_fixture("drama.html"), encoding="utf-8",
+        request=Request(DRAMA_URL))))
+    drama_data = dramalist.staging.pop(DRAMA_URL)
+    entry = (DRAMA_URL, fingerprint([DRAMA_URL]))
+
+    def scrap(response):
+        # Forgetting the dramas requested from the previous pages, which are
+        # the same
+        dramalist.building.clear()
+        dramalist.released.clear()
+        return dramalist.scrap(response)
+
+    def cast_meta():
+        dramalist.staging.put(DRAMA_URL, dict(drama_data))
+        return {"staging_key": DRAMA_URL, "entry": entry}
+
+    return {
+        "dramalist.scrap": callback_case(
+            scrap, TOP_URL, load_fixture("top.html"),
+            lambda: {"page": 1}),
+        "dramalist.parse_main_tab": callback_case(
+            dramalist.parse_main_tab, DRAMA_URL, load_fixture("drama.html"),
+            lambda: {"entry": entry}),
+        "dramalist.get_cast_members": callback_case(
+            dramalist.get_cast_members, DRAMA_URL + "/cast",
+            load_fixture("cast.html"),
+            cast_meta),
+        "userdramalist.parse": callback_case(
+            userdramalist.parse, LIST_URL, load_fixture("userlist.html"),
+            lambda: {"user": "bench", "status": "completed"}),
+    }
+
+
+def measure(run, nb_units, nb_repeats=3, nb_traced_units=1):
+    """
+    Measuring a case. The time is the best of several runs, the allocations
+    being traced during separate shorter runs as tracing slows Python down.
+    The garbage is collected before each traced run, so that its peak does
+    not depend on when the collector last ran.
+
+    Args:
+        run (callable): function running the case
+        nb_units (int): number of pages (or items) per run
+        nb_repeats (int): number of timed runs (and of traced runs)
+        nb_traced_units (int): number of pages (or items) per traced run
+
+    Returns:
+        dict: metrics of the case
+    """
+    # Warming up the caches (compiled selectors, imports...)
+    run(min(nb_units, 10))
+    best = None
+    for _ in range(nb_repeats):
+        start = time.perf_counter()
+        nb_results = run(nb_units)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    peak = 0
+    for _ in range(nb_repeats):
+        gc.collect()
+        tracemalloc.start()
+        run(nb_traced_units)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "us_per_unit": round(best / nb_units * 1e6, 1),
+        "results_per_sec": round(nb_results / best),
+        "peak_alloc_kb": round(peak / 1024, 1),
+        # Kilobytes on Linux, bytes on macOS
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def get_machine():
+    """
+    Describing the machine running the suite, which a baseline is saved with
+
+    Returns:
+        dict: name, architecture and version of Python of the machine
+    """
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+    }
+
+
+def load_baseline(path):
+    """
+    Loading a baseline saved on the machine running the suite
+
+    Args:
+        path (str): JSON file of the baseline
+
+    Returns:
+        dict: metrics of each case in the baseline
+    """
+    if not os.path.exists(path):
+        sys.exit("No baseline found in {0}: run the suite with --save {0} "
+                 "on this machine first (e.g. before changing the "
+                 "code)".format(path))
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("machine") != get_machine():
+        sys.exit("The baseline {} was saved on another machine ({}): save "
+                 "it again on this one".format(path, baseline.get("machine")))
+
+    return baseline["results"]
+
+
+def compare(results, baseline, threshold):
+    """
+    Comparing the results with a baseline
+
+    Args:
+        results (dict): metrics of each case
+        baseline (dict): metrics of each case in the baseline
+        threshold (float): relative increase above which a metric regressed
+
+    Returns:
+        list: descriptions of the regressions
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            reference = baseline.get(name, {}).get(metric)
+            if not reference:
+                continue
+            change = metrics[metric] / reference - 1
+            if change > threshold:
+                regressions.append("{} {}: {} -> {} (+{:.0%})".format(
+                    name, metric, reference, metrics[metric], change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the callbacks of the spiders and the "
+                    "InsertItem pipeline")
+    parser.add_argument("--pages", type=int, default=500,
+                        help="number of pages parsed per run")
+    parser.add_argument("--items", type=int, default=5000,
+                        help="number of items inserted per run")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="JSON file of the baseline to compare with, "
+                             "saved on the same machine")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative increase considered as a regression")
+    parser.add_argument("--save", metavar="BASELINE",
+                        help="JSON file the results are saved in")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    results = {}
+    print("{:<34} {:>10} {:>12} {:>12} {:>8}".format(
+        "case", "us/unit", "results/s", "alloc KB", "RSS MB"))
+    for name, run in get_cases(args.items).items():
+        nb_units = args.items if name.startswith("InsertItem") \
+            else args.pages
+        nb_traced_units = 500 if name.startswith("InsertItem") else 1
+        metrics = measure(run, nb_units, nb_traced_units=nb_traced_units)
+        results[name] = metrics
+        print("{:<34} {:>10} {:>12} {:>12} {:>8}".format(
+            name, metrics["us_per_unit"], metrics["results_per_sec"],
+            metrics["peak_alloc_kb"], metrics["peak_rss_mb"]))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"machine": get_machine(), "results": results}, f,
+                      indent=2)
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regression beyond {:.0%}".format(args.threshold))
+
+
+if __name__ == "__main__":
+    main()
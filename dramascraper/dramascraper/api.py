@@ -0,0 +1,591 @@
+"""
+Read-only HTTP service serving the dramas of a crawl from memory, so that
+they can be looked up and filtered without querying MySQL :
+
+    python -m dramascraper.api --input dramas.jsonl --port 8000
+
+The dramas are loaded from the output of the dramalist spider : a feed in
+JSON lines or JSON (scrapy crawl dramalist -o dramas.jsonl) or a Parquet
+file written by the ParquetExport pipeline. When a directory is given, its
+most recent output is loaded. Sending SIGHUP to the process loads the most
+recent output again.
+
+Endpoints :
+
+    GET /dramas/<id>                  drama by MyDramaList id
+    GET /dramas/lookup?url=<url>      drama by MyDramaList url
+    GET /dramas?genre=...&tag=...&actor=...&country=...
+               &min_rating=...&max_rating=...&offset=...&limit=...
+    GET /health                       number of dramas and version
+
+The JSON of every drama is serialized once at load time, and the values of
+the filters are indexed in inverted indexes (value -> positions of the
+dramas, in the order of the ranking), so that a request never serializes or
+scans the whole catalog. Each response has an ETag (the version of the
+catalog for the queries), a request whose If-None-Match matches being
+answered with 304. The pages of the queries are streamed with the chunked
+transfer encoding.
+"""
+import argparse
+import asyncio
+import bisect
+import glob
+import hashlib
+import json
+import logging
+import os
+import signal
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# Filters of the queries, with the fields whose values they match (case
+# insensitively, a drama matching every value given)
+FILTERS = {
+    "genre": ("genres",),
+    "tag": ("tags",),
+    "actor": ("main_roles", "support_roles", "guest_roles"),
+    "country": ("country_origin",),
+}
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+# Number of query results kept in the cache of the catalog
+QUERY_CACHE_SIZE = 1024
+# Size of the chunks of the streamed responses
+CHUNK_SIZE = 64 * 1024
+# Maximum size of the request line and headers of a request
+MAX_HEADER_SIZE = 16 * 1024
+# Patterns of the outputs of the dramalist spider found in a directory
+OUTPUT_PATTERNS = ("*.jsonl", "*.jl", "*.json", "dramalist-*.parquet")
+REASONS = {
+    200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 431: "Request Header Fields Too Large",
+}
+
+
+def find_output(path):
+    """
+    Retrieving the output of a crawl to load
+
+    Args:
+        path (str): output file, or directory of outputs
+
+    Returns:
+        str: path of the file (the most recent output of a directory)
+    """
+    if not os.path.isdir(path):
+        return path
+    paths = [found for pattern in OUTPUT_PATTERNS
+             for found in glob.glob(os.path.join(path, pattern))]
+    if not paths:
+        raise FileNotFoundError("No output of the dramalist spider in " +
+                                path)
+
+    return max(paths, key=os.path.getmtime)
+
+
+def read_items(path):
+    """
+    Reading the items of an output of the dramalist spider
+
+    Args:
+        path (str): JSON lines (.jsonl, .jl), JSON (.json) or Parquet
+        (.parquet) file
+
+    Yields:
+        dict: drama
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("The pyarrow package is required to load "
+                               "Parquet files")
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+    elif path.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            yield from json.load(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def normalize(value):
+    return value.strip().casefold()
+
+
+def normalize_url(url):
+    return url.strip().rstrip("/")
+
+
+class DramaCatalog:
+    """
+    Dramas held in memory, with their serialized JSON and the indexes of
+    their ids, urls and filter values
+    """
+
+    def __init__(self, items):
+        dramas = {}
+        for item in items:
+            item.pop("field_errors", None)
+            key = item.get("mydramalist_id") or item.get("mydramalist_url")
+            # The last record of a drama scraped several times is kept
+            dramas[key] = item
+        # Positions in the order of the ranking, the unranked dramas last
+        dramas = sorted(dramas.values(), key=lambda item: (
+            item.get("ranking") is None, item.get("ranking") or 0))
+        self.bodies = []
+        self.etags = []
+        self.by_id = {}
+        self.by_url = {}
+        # Positions of the dramas, by filter and by value
+        postings = {name: {} for name in FILTERS}
+        ratings = []
+        version = hashlib.sha1()
+        for position, item in enumerate(dramas):
+            body = json.dumps(item, ensure_ascii=False).encode("utf-8")
+            digest = hashlib.sha1(body).hexdigest()
+            version.update(digest.encode("ascii"))
+            self.bodies.append(body)
+            self.etags.append('"{}"'.format(digest[:20]))
+            if item.get("mydramalist_id") is not None:
+                self.by_id[item["mydramalist_id"]] = position
+            if item.get("mydramalist_url"):
+                self.by_url[normalize_url(item["mydramalist_url"])] = position
+            for name, fields in FILTERS.items():
+                values = set()
+                for field in fields:
+                    value = item.get(field)
+                    if isinstance(value, str):
+                        values.add(normalize(value))
+                    elif value:
+                        values.update(normalize(v) for v in value if v)
+                for value in values:
+                    postings[name].setdefault(value, []).append(position)
+            if item.get("ratings") is not None:
+                ratings.append((item["ratings"], position))
+        self.posting_sets = {
+            name: {value: frozenset(positions)
+                   for value, positions in values.items()}
+            for name, values in postings.items()
+        }
+        ratings.sort()
+        self.ratings = [rating for rating, _ in ratings]
+        self.rating_positions = [position for _, position in ratings]
+        self.version = version.hexdigest()[:16]
+        self.query_cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def query(self, filters, min_rating=None, max_rating=None):
+        """
+        Retrieving the dramas matching filters
+
+        Args:
+            filters (list): (filter, normalized value) tuples, which must all
+            match
+            min_rating (float): minimum rating (None for no minimum)
+            max_rating (float): maximum rating (None for no maximum)
+
+        Returns:
+            list: positions of the matching dramas, in the order of the
+            ranking
+        """
+        key = (tuple(sorted(filters)), min_rating, max_rating)
+        positions = self.query_cache.get(key)
+        if positions is not None:
+            self.query_cache.move_to_end(key)
+            return positions
+
+        sets = []
+        if min_rating is not None or max_rating is not None:
+            start = 0 if min_rating is None \
+                else bisect.bisect_left(self.ratings, min_rating)
+            end = len(self.ratings) if max_rating is None \
+                else bisect.bisect_right(self.ratings, max_rating)
+            sets.append(self.rating_positions[start:end])
+        for name, value in filters:
+            sets.append(self.posting_sets[name].get(value, frozenset()))
+        if not sets:
+            positions = range(len(self.bodies))
+        else:
+            # Starting from the smallest set, and checking the positions
+            # against the other ones
+            sets.sort(key=len)
+            smallest, others = sets[0], [set(s) if isinstance(s, list)
+                                         else s for s in sets[1:]]
+            positions = sorted(position for position in smallest
+                               if all(position in s for s in others))
+
+        self.query_cache[key] = positions
+        if len(self.query_cache) > QUERY_CACHE_SIZE:
+            self.query_cache.popitem(last=False)
+        return positions
+
+
+def load_catalog(path):
+    """
+    Loading the most recent output of the dramalist spider
+
+    Args:
+        path (str): output file, or directory of outputs
+
+    Returns:
+        DramaCatalog: dramas
+    """
+    start = time.perf_counter()
+    path = find_output(path)
+    catalog = DramaCatalog(read_items(path))
+    logging.info("Loaded %d dramas from %s in %.1f s (version %s)",
+                 len(catalog), path, time.perf_counter() - start,
+                 catalog.version)
+
+    return catalog
+
+
+class BadRequest(Exception):
+    pass
+
+
+class ApiServer:
+    """
+    HTTP/1.1 server answering the requests of each connection in turn (the
+    connections are kept alive)
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    async def handle(self, reader, writer):
+        """
+        Answering the requests of a connection until it is closed
+
+        Args:
+            reader (asyncio.StreamReader): stream of the requests
+            writer (asyncio.StreamWriter): stream of the responses
+        """
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, "GET", 431,
+                                    error_body("Request too large"),
+                                    keep_alive=False)
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                parts = lines[0].split(" ")
+                if len(parts) != 3:
+                    break
+                method, target, version = parts
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                # Discarding the body of the request, if any
+                length = int(headers.get("content-length") or 0)
+                if length:
+                    await reader.readexactly(length)
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" \
+                    else connection == "keep-alive"
+                await self.respond(writer, method, target, headers,
+                                   keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, method, target, headers, keep_alive):
+        """
+        Answering a request
+
+        Args:
+            writer (asyncio.StreamWriter): stream of the responses
+            method (str): method of the request
+            target (str): path and query of the request
+            headers (dict): headers of the request, by lowercase name
+            keep_alive (bool): whether the connection is kept open
+        """
+        if method not in ("GET", "HEAD"):
+            await self.send(writer, method, 405,
+                            error_body("Only GET and HEAD are allowed"),
+                            keep_alive=keep_alive)
+            return
+        # The catalog can be replaced while a page is streamed
+        catalog = self.catalog
+        parts = urlsplit(target)
+        params = parse_qs(parts.query)
+        path = parts.path.rstrip("/")
+        try:
+            if path == "/dramas":
+                query = parse_query(params)
+                etag = query_etag(catalog, params)
+                if not_modified(headers, etag):
+                    await self.send(writer, method, 304, etag=etag,
+                                    keep_alive=keep_alive)
+                else:
+                    await self.stream(writer, method, catalog, query, params,
+                                      etag, keep_alive)
+                return
+            if path == "/dramas/lookup":
+                url = params.get("url", [""])[0]
+                position = catalog.by_url.get(normalize_url(url))
+            elif path.startswith("/dramas/"):
+                drama_id = path[len("/dramas/"):]
+                position = catalog.by_id.get(int(drama_id)) \
+                    if drama_id.isdigit() else None
+            elif path == "/health":
+                body = json.dumps({"dramas": len(catalog),
+                                   "version": catalog.version})
+                await self.send(writer, method, 200, body.encode("utf-8"),
+                                keep_alive=keep_alive)
+                return
+            else:
+                raise KeyError(path)
+        except BadRequest as e:
+            await self.send(writer, method, 400, error_body(str(e)),
+                            keep_alive=keep_alive)
+            return
+        except KeyError:
+            position = None
+        if position is None:
+            await self.send(writer, method, 404, error_body("Not found"),
+                            keep_alive=keep_alive)
+            return
+        etag = catalog.etags[position]
+        if not_modified(headers, etag):
+            await self.send(writer, method, 304, etag=etag,
+                            keep_alive=keep_alive)
+        else:
+            await self.send(writer, method, 200, catalog.bodies[position],
+                            etag=etag, keep_alive=keep_alive)
+
+    async def send(self, writer, method, status, body=b"", etag=None,
+                   keep_alive=True):
+        """
+        Sending a response whose body is known
+
+        Args:
+            writer (asyncio.StreamWriter): stream of the responses
+            method (str): method of the request
+            status (int): status of the response
+            body (bytes): JSON body
+            etag (str): ETag of the response, if any
+            keep_alive (bool): whether the connection is kept open
+        """
+        head = response_head(status, etag, keep_alive,
+                             "Content-Length: {}".format(len(body)))
+        writer.write(head if method == "HEAD" or status == 304
+                     else head + body)
+        await writer.drain()
+
+    async def stream(self, writer, method, catalog, query, params, etag,
+                     keep_alive):
+        """
+        Streaming a page of the dramas matching a query
+
+        Args:
+            writer (asyncio.StreamWriter): stream of the responses
+            method (str): method of the request
+            catalog (DramaCatalog): dramas
+            query (tuple): query parsed by parse_query
+            params (dict): parameters of the query
+            etag (str): ETag of the response
+            keep_alive (bool): whether the connection is kept open
+        """
+        filters, min_rating, max_rating, offset, limit = query
+        positions = catalog.query(filters, min_rating, max_rating)
+        page = positions[offset:offset + limit]
+        next_url = None
+        if offset + limit < len(positions):
+            params = dict(params, offset=[str(offset + limit)])
+            next_url = "/dramas?" + urlencode(params, doseq=True)
+        head = response_head(200, etag, keep_alive,
+                             "Transfer-Encoding: chunked")
+        writer.write(head)
+        if method == "HEAD":
+            await writer.drain()
+            return
+        chunk = [json.dumps({
+            "total": len(positions), "offset": offset, "limit": limit,
+            "next": next_url})[:-1].encode("utf-8") + b', "items": [']
+        size = len(chunk[0])
+        for index, position in enumerate(page):
+            body = catalog.bodies[position]
+            chunk.append(b"," + body if index else body)
+            size += len(body) + 1
+            if size >= CHUNK_SIZE:
+                await write_chunk(writer, b"".join(chunk))
+                chunk, size = [], 0
+        chunk.append(b"]}")
+        await write_chunk(writer, b"".join(chunk))
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def parse_query(params):
+    """
+    Parsing the parameters of a query
+
+    Args:
+        params (dict): values of each parameter
+
+    Returns:
+        tuple: filters, minimum and maximum ratings, offset and limit
+    """
+    filters = [(name, normalize(value))
+               for name in FILTERS for value in params.get(name, [])]
+    try:
+        min_rating = float(params["min_rating"][0]) \
+            if "min_rating" in params else None
+        max_rating = float(params["max_rating"][0]) \
+            if "max_rating" in params else None
+        offset = int(params.get("offset", ["0"])[0])
+        limit = int(params.get("limit", [str(DEFAULT_LIMIT)])[0])
+    except ValueError as e:
+        raise BadRequest("Invalid parameter: {}".format(e))
+    if offset < 0 or not 0 < limit <= MAX_LIMIT:
+        raise BadRequest("The offset must be positive and the limit "
+                         "between 1 and {}".format(MAX_LIMIT))
+
+    return filters, min_rating, max_rating, offset, limit
+
+
+def query_etag(catalog, params):
+    """
+    Computing the ETag of a query, which changes with the catalog
+
+    Args:
+        catalog (DramaCatalog): dramas
+        params (dict): parameters of the query
+
+    Returns:
+        str: ETag
+    """
+    query = urlencode(sorted(params.items()), doseq=True)
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+
+    return '"{}-{}"'.format(catalog.version, digest)
+
+
+def not_modified(headers, etag):
+    """
+    Checking whether the client already holds the response
+
+    Args:
+        headers (dict): headers of the request, by lowercase name
+        etag (str): ETag of the response
+
+    Returns:
+        bool: True if the If-None-Match header matches the ETag
+    """
+    tags = headers.get("if-none-match")
+    if not tags:
+        return False
+    tags = [tag.strip() for tag in tags.split(",")]
+
+    return "*" in tags or etag in tags or "W/" + etag in tags
+
+
+def response_head(status, etag, keep_alive, framing):
+    """
+    Building the status line and the headers of a response
+
+    Args:
+        status (int): status of the response
+        etag (str): ETag of the response, if any
+        keep_alive (bool): whether the connection is kept open
+        framing (str): Content-Length or Transfer-Encoding header
+
+    Returns:
+        bytes: head of the response
+    """
+    lines = [
+        "HTTP/1.1 {} {}".format(status, REASONS[status]),
+        "Content-Type: application/json; charset=utf-8",
+        "Connection: " + ("keep-alive" if keep_alive else "close"),
+    ]
+    if etag is not None:
+        lines.append("ETag: " + etag)
+        lines.append("Cache-Control: no-cache")
+    if status != 304:
+        lines.append(framing)
+
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def write_chunk(writer, data):
+    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+    await writer.drain()
+
+
+def error_body(message):
+    return json.dumps({"error": message}).encode("utf-8")
+
+
+async def serve(path, host="127.0.0.1", port=8000):
+    """
+    Serving the dramas until the process is interrupted
+
+    Args:
+        path (str): output of the dramalist spider, or directory of outputs
+        host (str): address the server listens on
+        port (int): port the server listens on
+    """
+    api = ApiServer(load_catalog(path))
+    loop = asyncio.get_running_loop()
+    reloading = None
+
+    def reload():
+        # The catalog is loaded in a thread, so that the requests are still
+        # answered from the current one until it is swapped
+        nonlocal reloading
+        if reloading is not None and not reloading.done():
+            logging.info("The catalog is already being loaded again")
+            return
+        reloading = loop.run_in_executor(None, load_catalog, path)
+        reloading.add_done_callback(reloaded)
+
+    def reloaded(future):
+        try:
+            api.catalog = future.result()
+        except Exception:
+            logging.exception("The catalog could not be loaded again")
+
+    if hasattr(signal, "SIGHUP"):
+        loop.add_signal_handler(signal.SIGHUP, reload)
+    server = await asyncio.start_server(api.handle, host, port,
+                                        limit=MAX_HEADER_SIZE)
+    print("Serving {} dramas on http://{}:{}".format(
+        len(api.catalog), host, port))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve the dramas scraped by the dramalist spider")
+    parser.add_argument("--input", required=True,
+                        help="output of the dramalist spider (JSON lines, "
+                             "JSON or Parquet), or directory of outputs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.input, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Checkpoint of a dramalist crawl, allowing an interrupted crawl to be resumed
+where it stopped.
+
+The progress of the crawl is appended to a journal (one JSON object per line)
+as it happens :
+    - {"page": n, "urls": [[url, fingerprint], ...]} once a page of the top
+      shows has been scraped, with the dramas it led to request
+    - {"cast": url, "fingerprint": ..., "data": {...}} once the page of a
+      drama has been scraped, with the information waiting for its cast
+      members
+    - {"done": url} once all the information of a drama has been retrieved
+
+Unlike the JOBDIR of Scrapy, which pickles the requests, the journal only
+contains plain JSON values and can be read by another version of the code.
+"""
+import json
+import logging
+import os
+
+
+class Checkpoint:
+    """
+    Journal of the progress of a crawl. When opened, the journal of a
+    previous crawl is loaded and compacted (the lines of the finished dramas
+    are dropped).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Drama urls requested from each scraped page of the top shows
+        self.pages = {}
+        # Fingerprint and information waiting for the cast members, by drama
+        # url
+        self.casts = {}
+        # Urls of the dramas whose information has been entirely retrieved
+        self.done = set()
+        if os.path.exists(path):
+            self.load()
+            self.compact()
+        self.journal = open(path, "a", encoding="utf-8")
+
+    def load(self):
+        """
+        Reading the journal of a previous crawl. An incomplete last line
+        (written when the crawl was killed) is ignored.
+        """
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    logging.warning("Ignoring an incomplete line of %s",
+                                    self.path)
+                    continue
+                if "page" in event:
+                    self.pages[event["page"]] = event["urls"]
+                elif "cast" in event:
+                    self.casts[event["cast"]] = (event["fingerprint"],
+                                                 event["data"])
+                elif "done" in event:
+                    self.done.add(event["done"])
+                    self.casts.pop(event["done"], None)
+
+    def compact(self):
+        """
+        Rewriting the journal without the information of the finished dramas
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for page, urls in self.pages.items():
+                f.write(json.dumps({"page": page, "urls": urls}) + "\n")
+            for url, (entry_fingerprint, data) in self.casts.items():
+                f.write(json.dumps({"cast": url,
+                                    "fingerprint": entry_fingerprint,
+                                    "data": data}) + "\n")
+            for url in self.done:
+                f.write(json.dumps({"done": url}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def write(self, event):
+        self.journal.write(json.dumps(event) + "\n")
+        self.journal.flush()
+
+    def page_scraped(self, page, urls):
+        """
+        Recording that a page of the top shows has been scraped
+
+        Args:
+            page (int): number of the page
+            urls (list): list of (url, fingerprint) tuples of the dramas
+            requested from this page
+        """
+        urls = [list(url) for url in urls]
+        self.pages[page] = urls
+        self.write({"page": page, "urls": urls})
+
+    def cast_requested(self, url, entry_fingerprint, data):
+        """
+        Recording that the cast tab of a drama has been requested
+
+        Args:
+            url (str): url of the drama on the top shows
+            entry_fingerprint (str): fingerprint of the drama's entry on the
+            top shows
+            data (dict): information about the drama waiting for its cast
+        """
+        self.casts[url] = (entry_fingerprint, data)
+        self.write({"cast": url, "fingerprint": entry_fingerprint,
+                    "data": data})
+
+    def drama_done(self, url):
+        """
+        Recording that all the information of a drama has been retrieved
+
+        Args:
+            url (str): url of the drama on the top shows
+        """
+        self.done.add(url)
+        self.casts.pop(url, None)
+        self.write({"done": url})
+
+    def pending_dramas(self):
+        """
+        Retrieving the dramas found on the scraped pages of the top shows
+        whose page has not been scraped yet
+
+        Returns:
+            list: list of (url, fingerprint, page, position) tuples, the
+            position being the one of the drama among the ones requested from
+            its page
+        """
+        return [
+            (url, entry_fingerprint, int(page), position)
+            for page, urls in self.pages.items()
+            for position, (url, entry_fingerprint) in enumerate(urls)
+            if url not in self.done and url not in self.casts
+        ]
+
+    def pending_casts(self):
+        """
+        Retrieving the dramas whose cast tab has been requested but not
+        scraped yet
+
+        Returns:
+            list: list of (url, fingerprint, data) tuples
+        """
+        return [
+            (url, entry_fingerprint, data)
+            for url, (entry_fingerprint, data) in self.casts.items()
+        ]
+
+    def close(self, finished=False):
+        """
+        Closing the journal, which is deleted if the crawl finished
+
+        Args:
+            finished (bool): True if the crawl finished normally
+        """
+        self.journal.close()
+        if finished:
+            os.remove(self.path)
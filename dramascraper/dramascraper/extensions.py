@@ -0,0 +1,265 @@
+"""
+Extensions of the dramascraper project.
+
+See documentation in:
+https://docs.scrapy.org/en/latest/topics/extensions.html
+"""
+import functools
+import inspect
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+
+def get_url(value):
+    """
+    Retrieving the url of the page an extractor argument comes from
+
+    Args:
+        value: argument given to an extractor (response, selector, lxml
+        element or text)
+
+    Returns:
+        str: url of the page. Equals to None if it is unknown.
+    """
+    url = getattr(value, "url", None)
+    if isinstance(url, str):
+        return url
+    node = getattr(value, "root", value)
+    if hasattr(node, "getroottree"):
+        return node.getroottree().docinfo.URL
+    return None
+
+
+class FieldMeasures:
+    """
+    Measures of the calls to an extractor : number of calls, histogram of
+    their duration, None values and exceptions, with sample urls of the pages
+    that led to a None value or an exception
+    """
+
+    def __init__(self, buckets, nb_samples):
+        self.buckets = buckets
+        self.nb_samples = nb_samples
+        self.nb_calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        # Number of calls per bucket (the last one being +Inf)
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.nb_none = 0
+        self.errors = {}
+        self.none_samples = []
+        self.error_samples = []
+
+    def add_sample(self, samples, url):
+        if url and len(samples) < self.nb_samples and url not in samples:
+            samples.append(url)
+
+    def record(self, elapsed, url, is_none=False, error=None):
+        """
+        Recording a call to the extractor
+
+        Args:
+            elapsed (float): duration of the call, in seconds
+            url (str): url of the page
+            is_none (bool): True if the extractor returned None
+            error (str): name of the exception raised, if any
+        """
+        self.nb_calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        for i, bound in enumerate(self.buckets):
+            if elapsed <= bound:
+                self.bucket_counts[i] += 1
+                break
+        else:
+            self.bucket_counts[-1] += 1
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+            self.add_sample(self.error_samples, url)
+        elif is_none:
+            self.nb_none += 1
+            self.add_sample(self.none_samples, url)
+
+
+class FieldStats:
+    """
+    Extension instrumenting the get_* extractors of the spider : the time
+    spent in each of them, the None values they return and the exceptions
+    they raise are exported in the stats (fields/<extractor>/...) and, when
+    FIELD_STATS_PROMETHEUS_FILE is set, in a file in the text format of
+    Prometheus (e.g. for the textfile collector of the node exporter).
+
+    The time of an extractor calling other extractors (e.g. get_details)
+    includes theirs.
+    """
+    # Upper bounds (in seconds) of the buckets of the duration histograms
+    BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+
+    def __init__(self, stats, path=None, interval=60, nb_samples=5):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.nb_samples = nb_samples
+        self.fields = {}
+        # Url of the page the extractors are working on
+        self.url = None
+        self.export_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("FIELD_STATS_ENABLED"):
+            raise NotConfigured
+        extension = cls(
+            crawler.stats,
+            path=settings.get("FIELD_STATS_PROMETHEUS_FILE"),
+            interval=settings.getfloat("FIELD_STATS_INTERVAL", 60),
+            nb_samples=settings.getint("FIELD_STATS_SAMPLES", 5)
+        )
+        crawler.signals.connect(extension.spider_opened,
+                                signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed,
+                                signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.instrument(spider)
+        if self.path and self.interval:
+            self.export_loop = task.LoopingCall(self.export, spider)
+            self.export_loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.export_loop is not None and self.export_loop.running:
+            self.export_loop.stop()
+        self.export(spider)
+
+    def instrument(self, spider):
+        """
+        Replacing each get_* extractor of a spider by a measured one. The
+        callbacks (generators such as get_cast_members) are left untouched.
+
+        Args:
+            spider (scrapy.Spider): spider
+        """
+        for name in dir(type(spider)):
+            if not name.startswith("get_"):
+                continue
+            function = getattr(type(spider), name)
+            if not inspect.isfunction(function) or \
+                    inspect.isgeneratorfunction(function):
+                continue
+            setattr(spider, name, self.measure(name, getattr(spider, name)))
+
+    def measure(self, name, method):
+        """
+        Wrapping an extractor so that its calls are measured
+
+        Args:
+            name (str): name of the extractor
+            method (callable): bound method
+
+        Returns:
+            callable: measured method
+        """
+        measures = FieldMeasures(self.BUCKETS, self.nb_samples)
+        self.fields[name] = measures
+
+        @functools.wraps(method)
+        def measured(*args, **kwargs):
+            if args:
+                self.url = get_url(args[0]) or self.url
+            start = time.perf_counter()
+            try:
+                value = method(*args, **kwargs)
+            except Exception as e:
+                measures.record(time.perf_counter() - start, self.url,
+                                error=type(e).__name__)
+                raise
+            measures.record(time.perf_counter() - start, self.url,
+                            is_none=value is None)
+            return value
+
+        return measured
+
+    def export(self, spider):
+        """
+        Exporting the measures in the stats and in the Prometheus file
+
+        Args:
+            spider (scrapy.Spider): spider
+        """
+        for name, measures in self.fields.items():
+            if not measures.nb_calls:
+                continue
+            prefix = "fields/{}/".format(name)
+            self.stats.set_value(prefix + "calls", measures.nb_calls)
+            self.stats.set_value(prefix + "mean_us", round(
+                measures.total_time / measures.nb_calls * 1e6, 1))
+            self.stats.set_value(prefix + "max_us",
+                                 round(measures.max_time * 1e6, 1))
+            self.stats.set_value(prefix + "none", measures.nb_none)
+            for error, count in measures.errors.items():
+                self.stats.set_value(prefix + "errors/" + error, count)
+            if measures.none_samples:
+                self.stats.set_value(prefix + "none_samples",
+                                     list(measures.none_samples))
+            if measures.error_samples:
+                self.stats.set_value(prefix + "error_samples",
+                                     list(measures.error_samples))
+        if self.path:
+            self.write_prometheus(spider.name)
+
+    def write_prometheus(self, spider_name):
+        """
+        Writing the measures in the text format of Prometheus. The file is
+        replaced atomically so that it is never read half-written.
+
+        Args:
+            spider_name (str): name of the spider, used as label
+        """
+        lines = [
+            "# HELP dramascraper_field_duration_seconds Time spent in each "
+            "extractor",
+            "# TYPE dramascraper_field_duration_seconds histogram",
+        ]
+        for name, measures in sorted(self.fields.items()):
+            labels = 'spider="{}",field="{}"'.format(spider_name, name)
+            cumulated = 0
+            bounds = [repr(bound) for bound in self.BUCKETS] + ["+Inf"]
+            for bound, count in zip(bounds, measures.bucket_counts):
+                cumulated += count
+                lines.append(
+                    'dramascraper_field_duration_seconds_bucket{{{},le="{}"}} '
+                    '{}'.format(labels, bound, cumulated))
+            lines.append("dramascraper_field_duration_seconds_sum{{{}}} {}"
+                         .format(labels, measures.total_time))
+            lines.append("dramascraper_field_duration_seconds_count{{{}}} {}"
+                         .format(labels, measures.nb_calls))
+        lines += [
+            "# HELP dramascraper_field_none_total Calls of each extractor "
+            "that returned None",
+            "# TYPE dramascraper_field_none_total counter",
+        ]
+        for name, measures in sorted(self.fields.items()):
+            lines.append(
+                'dramascraper_field_none_total{{spider="{}",field="{}"}} {}'
+                .format(spider_name, name, measures.nb_none))
+        lines += [
+            "# HELP dramascraper_field_errors_total Calls of each extractor "
+            "that raised an exception",
+            "# TYPE dramascraper_field_errors_total counter",
+        ]
+        for name, measures in sorted(self.fields.items()):
+            for error, count in sorted(measures.errors.items()):
+                lines.append(
+                    'dramascraper_field_errors_total{{spider="{}",field="{}",'
+                    'exception="{}"}} {}'.format(spider_name, name, error,
+                                                 count))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,343 @@
+"""
+Crawl frontier shared by several processes (possibly on several machines)
+running the same dramalist crawl.
+
+The urls to request are added to the frontier, which deduplicates them
+globally. Each worker claims a few urls at a time and acknowledges them once
+they have been scraped. A claimed url that is not acknowledged within the
+lease duration (e.g. because its worker died) can be claimed again, so that
+a crawl can always be resumed. A url whose scraping failed is given back to
+the frontier, until it has been claimed a maximum number of times : it is
+then given up, so that the crawl ends.
+
+Two storages are available :
+    - a SQLite file, that can be located on a shared disk
+      (sqlite:///path/to/frontier.sqlite3)
+    - a Redis server or any server compatible with its protocol
+      (redis://host:port/db), which requires the redis package
+"""
+import json
+import sqlite3
+import time
+
+
+def open_frontier(uri, lease=600, max_attempts=3):
+    """
+    Opening the frontier located at a given uri
+
+    Args:
+        uri (str): sqlite:///<path> or redis://<host>:<port>/<db>
+        lease (int): number of seconds after which a claimed url that has not
+        been acknowledged can be claimed again
+        max_attempts (int): number of times a url can be claimed before it is
+        given up
+
+    Returns:
+        SqliteFrontier or RedisFrontier: frontier
+    """
+    if uri.startswith("sqlite://"):
+        return SqliteFrontier(uri[len("sqlite://"):], lease,
+                              max_attempts)
+    if uri.startswith(("redis://", "rediss://", "unix://")):
+        return RedisFrontier(uri, lease, max_attempts)
+    raise ValueError("Unsupported frontier: {}".format(uri))
+
+
+class SqliteFrontier:
+    """
+    Frontier stored in a SQLite file. Every claim runs in an immediate
+    transaction so that a url is never claimed by two workers at the same
+    time.
+    """
+    PENDING, CLAIMED, DONE, FAILED = 0, 1, 2, 3
+
+    def __init__(self, path, lease=600, max_attempts=3):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        # Transactions are explicitly started to lock the file while claiming
+        self.connection = sqlite3.connect(path, timeout=60,
+                                          isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS frontier ("
+            "url TEXT PRIMARY KEY, kind TEXT NOT NULL, "
+            "priority INTEGER NOT NULL, payload TEXT, "
+            "state INTEGER NOT NULL, worker TEXT, claimed_at REAL, "
+            "attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS frontier_state "
+            "ON frontier (state, priority)"
+        )
+
+    def add(self, kind, entries):
+        """
+        Adding urls that have never been added to the frontier
+
+        Args:
+            kind (str): kind of page (e.g. 'top' or 'drama')
+            entries (list): list of (url, priority, payload) tuples. The urls
+            with the lowest priority are claimed first and the payload is a
+            string (or None) returned with the url when it is claimed.
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO frontier (url, kind, priority, payload, "
+            "state) VALUES (?, ?, ?, ?, ?)",
+            [(url, kind, priority, payload, self.PENDING)
+             for url, priority, payload in entries]
+        )
+        self.connection.execute("COMMIT")
+
+    def claim(self, worker, nb_urls):
+        """
+        Claiming the pending urls with the lowest priority, as well as the
+        urls whose lease expired. The urls whose lease expired after their
+        last attempt are given up.
+
+        Args:
+            worker (str): name of the worker claiming the urls
+            nb_urls (int): maximum number of urls to claim
+
+        Returns:
+            list: list of (url, kind, payload) tuples
+        """
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        self.connection.execute(
+            "UPDATE frontier SET state = ? "
+            "WHERE state = ? AND claimed_at < ? AND attempts >= ?",
+            (self.FAILED, self.CLAIMED, now - self.lease, self.max_attempts)
+        )
+        rows = self.connection.execute(
+            "SELECT url, kind, payload FROM frontier "
+            "WHERE state = ? OR (state = ? AND claimed_at < ?) "
+            "ORDER BY state, priority LIMIT ?",
+            (self.PENDING, self.CLAIMED, now - self.lease, nb_urls)
+        ).fetchall()
+        self.connection.executemany(
+            "UPDATE frontier SET state = ?, worker = ?, claimed_at = ?, "
+            "attempts = attempts + 1 WHERE url = ?",
+            [(self.CLAIMED, worker, now, url) for url, _, _ in rows]
+        )
+        self.connection.execute("COMMIT")
+
+        return rows
+
+    def ack(self, url):
+        """
+        Acknowledging that a claimed url has been scraped
+
+        Args:
+            url (str): url claimed
+        """
+        self.connection.execute(
+            "UPDATE frontier SET state = ? WHERE url = ?", (self.DONE, url))
+
+    def fail(self, url):
+        """
+        Giving back a claimed url whose scraping failed, so that it is claimed
+        again unless it has already been claimed the maximum number of times
+
+        Args:
+            url (str): url claimed
+
+        Returns:
+            bool: True if the url is given up
+        """
+        self.connection.execute(
+            "UPDATE frontier SET state = CASE WHEN attempts >= ? THEN ? "
+            "ELSE ? END WHERE url = ? AND state = ?",
+            (self.max_attempts, self.FAILED, self.PENDING, url, self.CLAIMED)
+        )
+        row = self.connection.execute(
+            "SELECT state FROM frontier WHERE url = ?", (url,)).fetchone()
+
+        return row is not None and row[0] == self.FAILED
+
+    def has_pending(self):
+        """
+        Checking whether some urls are still pending or claimed by a worker
+
+        Returns:
+            bool: True if the crawl is not finished
+        """
+        row = self.connection.execute(
+            "SELECT 1 FROM frontier WHERE state IN (?, ?) LIMIT 1",
+            (self.PENDING, self.CLAIMED)
+        ).fetchone()
+
+        return row is not None
+
+    def close(self):
+        self.connection.close()
+
+
+class RedisFrontier:
+    """
+    Frontier stored in a Redis server (or a server compatible with its
+    protocol). The urls ever added are stored in a set, the pending ones in a
+    sorted set ordered by priority and the claimed ones in a hash storing the
+    time they were claimed at. The number of times each url was claimed is
+    stored in a hash and the urls given up in a set.
+    """
+
+    def __init__(self, uri, lease=600, max_attempts=3,
+                 prefix="dramascraper:frontier"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required to use a Redis "
+                              "frontier")
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.redis = redis.Redis.from_url(uri, decode_responses=True)
+        self.seen_key = prefix + ":seen"
+        self.queue_key = prefix + ":queue"
+        self.entries_key = prefix + ":entries"
+        self.claimed_key = prefix + ":claimed"
+        self.attempts_key = prefix + ":attempts"
+        self.failed_key = prefix + ":failed"
+
+    def add(self, kind, entries):
+        """
+        Adding urls that have never been added to the frontier
+
+        Args:
+            kind (str): kind of page (e.g. 'top' or 'drama')
+            entries (list): list of (url, priority, payload) tuples. The urls
+            with the lowest priority are claimed first and the payload is a
+            string (or None) returned with the url when it is claimed.
+        """
+        entries = list(entries)
+        pipeline = self.redis.pipeline()
+        for url, _, _ in entries:
+            pipeline.sadd(self.seen_key, url)
+        added = pipeline.execute()
+
+        pipeline = self.redis.pipeline()
+        for (url, priority, payload), is_new in zip(entries, added):
+            if is_new:
+                pipeline.hset(self.entries_key, url,
+                              json.dumps([kind, priority, payload]))
+                pipeline.zadd(self.queue_key, {url: priority})
+        pipeline.execute()
+
+    def requeue_expired(self):
+        """
+        Adding back to the pending urls the claimed ones whose lease expired
+        """
+        deadline = time.time() - self.lease
+        for url, claimed_at in self.redis.hgetall(self.claimed_key).items():
+            if float(claimed_at) < deadline and \
+                    self.redis.hdel(self.claimed_key, url):
+                self.requeue(url)
+
+    def requeue(self, url):
+        """
+        Adding back to the pending urls a url that is no longer claimed, or
+        giving it up if it has been claimed the maximum number of times
+
+        Args:
+            url (str): url
+
+        Returns:
+            bool: True if the url is given up
+        """
+        entry = self.redis.hget(self.entries_key, url)
+        # The url has been acknowledged in the meantime
+        if entry is None:
+            return False
+        attempts = int(self.redis.hget(self.attempts_key, url) or 0)
+        if attempts >= self.max_attempts:
+            pipeline = self.redis.pipeline()
+            pipeline.hdel(self.entries_key, url)
+            pipeline.hdel(self.attempts_key, url)
+            pipeline.sadd(self.failed_key, url)
+            pipeline.execute()
+            return True
+        priority = json.loads(entry)[1]
+        self.redis.zadd(self.queue_key, {url: priority})
+
+        return False
+
+    def claim(self, worker, nb_urls):
+        """
+        Claiming the pending urls with the lowest priority, as well as the
+        urls whose lease expired. The urls whose lease expired after their
+        last attempt are given up.
+
+        Args:
+            worker (str): name of the worker claiming the urls
+            nb_urls (int): maximum number of urls to claim
+
+        Returns:
+            list: list of (url, kind, payload) tuples
+        """
+        popped = self.redis.zpopmin(self.queue_key, nb_urls)
+        if len(popped) < nb_urls:
+            self.requeue_expired()
+            popped += self.redis.zpopmin(self.queue_key,
+                                         nb_urls - len(popped))
+        if not popped:
+            return []
+        urls = [url for url, _ in popped]
+        now = time.time()
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.claimed_key, mapping={url: now for url in urls})
+        for url in urls:
+            pipeline.hincrby(self.attempts_key, url)
+        pipeline.execute()
+        entries = self.redis.hmget(self.entries_key, urls)
+        claimed = []
+        for url, entry in zip(urls, entries):
+            # The url may have been acknowledged by the worker whose lease
+            # expired in the meantime
+            if entry is None:
+                self.redis.hdel(self.claimed_key, url)
+                continue
+            kind, _, payload = json.loads(entry)
+            claimed.append((url, kind, payload))
+
+        return claimed
+
+    def ack(self, url):
+        """
+        Acknowledging that a claimed url has been scraped
+
+        Args:
+            url (str): url claimed
+        """
+        pipeline = self.redis.pipeline()
+        pipeline.hdel(self.claimed_key, url)
+        pipeline.hdel(self.entries_key, url)
+        pipeline.hdel(self.attempts_key, url)
+        pipeline.execute()
+
+    def fail(self, url):
+        """
+        Giving back a claimed url whose scraping failed, so that it is claimed
+        again unless it has already been claimed the maximum number of times
+
+        Args:
+            url (str): url claimed
+
+        Returns:
+            bool: True if the url is given up
+        """
+        if not self.redis.hdel(self.claimed_key, url):
+            return False
+
+        return self.requeue(url)
+
+    def has_pending(self):
+        """
+        Checking whether some urls are still pending or claimed by a worker
+
+        Returns:
+            bool: True if the crawl is not finished
+        """
+        return bool(self.redis.zcard(self.queue_key) or
+                    self.redis.hlen(self.claimed_key))
+
+    def close(self):
+        self.redis.close()
@@ -0,0 +1,210 @@
+"""
+Registry of the selectors and regular expressions used by the spiders to
+extract information from MyDramaList's pages.
+
+Every selector is compiled once at import time into an lxml.etree.XPath
+object and every regular expression into a re.Pattern, both keyed by the
+name of the field they extract. This is the only place to update when
+MyDramaList changes its markup.
+
+The selectors are applied to the lxml document of a response, built either by
+the Selector of Scrapy ('parsel' backend) or straight from the raw body of
+the response ('lxml' backend, see document).
+"""
+import re
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+_css_translator = HTMLTranslator()
+# Backends the documents can be built with
+BACKENDS = ("parsel", "lxml")
+# HTML parsers of the lxml backend, by encoding
+_parsers = {}
+
+
+def xpath(query):
+    """
+    Compiling an XPath expression
+
+    Args:
+        query (str): XPath expression
+
+    Returns:
+        lxml.etree.XPath: compiled expression
+    """
+    return etree.XPath(query, smart_strings=False)
+
+
+def css(query):
+    """
+    Compiling a CSS selector (the ::text and ::attr() pseudo-elements of
+    Scrapy are supported)
+
+    Args:
+        query (str): CSS selector
+
+    Returns:
+        lxml.etree.XPath: compiled expression
+    """
+    return xpath(_css_translator.css_to_xpath(query))
+
+
+SELECTORS = {
+    # Pages of the top shows
+    "drama_urls": css(".text-primary.title > a::attr(href)"),
+    "listing_entries": xpath(
+        "//div[@class='box'][descendant::h6[contains(@class, 'title')]]"
+    ),
+    "listing_texts": xpath(".//text()"),
+    # Drama's page
+    "name": css("title::text"),
+    "synopsis": xpath("//div[@class='show-synopsis']//span/text()"),
+    "rating": css(".deep-orange::text"),
+    "nb_ratings": xpath("//div[@class='hfs']/text()"),
+    "nb_reviews": xpath(
+        "//div[@class='hfs'][contains(., 'Reviews:')]/a/text()"
+    ),
+    "details": xpath("//li[@class='list-item p-a-0']"),
+    "details_label": xpath("./b/text()"),
+    "details_text": xpath("./text()"),
+    "streamed_on": xpath(
+        "//div[@class='box'][descendant::h3[contains(., 'Where to Watch')]]"
+        "//a[@class='text-primary']/b/text()"
+    ),
+    "genres": xpath(
+        "//li[@class='list-item p-a-0 show-genres'][child::b"
+        "[contains(., 'Genres')]]/a/text()"
+    ),
+    "tags": xpath(
+        "//li[@class='list-item p-a-0 show-tags'][child::b"
+        "[contains(., 'Tags')]]/span/a/text()"
+    ),
+    # Drama's cast page
+    "main_roles": xpath(
+        "//ul[preceding-sibling::h3[1][contains(., 'Main Role')]]/li//a"
+        "[@class='text-primary' and contains(@href, 'people')]/b/text()"
+    ),
+    "support_roles": xpath(
+        "//ul[preceding-sibling::h3[1][contains(., 'Support Role')]]/li//a"
+        "[@class='text-primary' and contains(@href, 'people')]/b/text()"
+    ),
+    "guest_roles": xpath(
+        "//ul[preceding-sibling::h3[1][contains(., 'Guest Role')]]/li//a"
+        "[@class='text-primary' and contains(@href, 'people')]/b/text()"
+    ),
+    "screenwriter": xpath(
+        "//ul[preceding-sibling::h3[1][contains(., 'Screenwriter')]]/li//a"
+        "[@class='text-primary text-ellipsis' and "
+        "contains(@href, 'people')]/b/text()"
+    ),
+    "director": xpath(
+        "//ul[preceding-sibling::h3[1][contains(., 'Director')]]/li//a"
+        "[@class='text-primary text-ellipsis' and "
+        "contains(@href, 'people')]/b/text()"
+    ),
+    # User's drama list (relative to a row for the title and the score)
+    "rows": css("tbody > tr"),
+    "title": css(".title.text-primary span::text"),
+    "title_url": xpath(
+        ".//a[contains(concat(' ', normalize-space(@class), ' '), ' title ')]"
+        "/@href"
+    ),
+    "score": css(".score::text"),
+    "next_page": css(".pagination .next > a::attr(href)"),
+}
+
+PATTERNS = {
+    "whitespaces": re.compile(r"\s+"),
+    "nb_ratings": re.compile(r"(\d+(?:\,\d+)*) user"),
+    "nb_reviews": re.compile(r"(\d*) user"),
+    "hours": re.compile(r"(\d*) hr\."),
+    "minutes": re.compile(r"(\d*) min\."),
+    # Numeric id at the beginning of the path of a drama's url
+    "drama_id": re.compile(r"^(?:https?://[^/]+)?/(\d+)"),
+    # Url of the page of a drama (and not of one of its tabs)
+    "drama_page": re.compile(
+        r"^https?://(?:www\.)?mydramalist\.com/\d+(?:-[^/?#]*)?/?$"
+    ),
+}
+
+
+def root(node):
+    """
+    Retrieving the lxml element a selector has to be applied to
+
+    Args:
+        node (scrapy.http.response, parsel.Selector or lxml element): node
+        to select from
+
+    Returns:
+        lxml element: element wrapped by the node
+    """
+    node = getattr(node, "selector", node)
+
+    return getattr(node, "root", node)
+
+
+def getall(field, node):
+    """
+    Applying the selector of a field
+
+    Args:
+        field (str): name of the field in SELECTORS
+        node (scrapy.http.response, parsel.Selector or lxml element): node
+        to select from
+
+    Returns:
+        list: matching strings or elements
+    """
+    return SELECTORS[field](root(node))
+
+
+def get(field, node, default=None):
+    """
+    Applying the selector of a field and keeping its first result
+
+    Args:
+        field (str): name of the field in SELECTORS
+        node (scrapy.http.response, parsel.Selector or lxml element): node
+        to select from
+        default: value returned when nothing matches
+
+    Returns:
+        First matching string or element
+    """
+    results = getall(field, node)
+
+    return results[0] if results else default
+
+
+def document(response, backend="parsel"):
+    """
+    Retrieving the lxml document the selectors are applied to
+
+    Args:
+        response (scrapy.http.response): response
+        backend (str): 'parsel' to use the Selector of the response, which
+        decodes the body, keeps the decoded text on the response and encodes
+        it again for lxml, or 'lxml' to parse the raw body directly with the
+        encoding of the response. The Selector is used whenever the body
+        cannot be parsed this way (unknown encoding, NUL bytes, empty body).
+
+    Returns:
+        lxml element: root of the document
+    """
+    if backend == "lxml" and b"\0" not in response.body:
+        encoding = response.encoding
+        parser = _parsers.get(encoding)
+        try:
+            if parser is None:
+                parser = etree.HTMLParser(encoding=encoding)
+                _parsers[encoding] = parser
+            root = etree.fromstring(response.body, parser=parser,
+                                    base_url=response.url)
+        except (LookupError, etree.LxmlError):
+            root = None
+        if root is not None:
+            return root
+
+    return response.selector.root
@@ -2,8 +2,17 @@
 #
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+import logging
+import random
+import re
+import time
 
 from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import error
+
+from dramascraper.useragents import USER_AGENTS
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
@@ -56,48 +65,282 @@ class DramascraperSpiderMiddleware:
         spider.logger.info('Spider opened: %s' % spider.name)
 
 
+# Classes of pages whose concurrency is adjusted separately, with the pattern
+# matched by the path of their urls (the first matching class is used)
+ENDPOINTS = [
+    ("top", re.compile(r"^/shows/top")),
+    ("cast", re.compile(r"^/\d+[^/]*/cast")),
+    ("dramalist", re.compile(r"^/dramalist/")),
+    ("drama", re.compile(r"^/\d+")),
+]
+
+
+class EndpointState:
+    """
+    Concurrency and delay currently used for a class of pages, with the
+    measures they are adjusted from
+    """
+
+    def __init__(self, concurrency, delay):
+        self.concurrency = concurrency
+        self.delay = delay
+        # Moving average of the download latency, in seconds
+        self.latency = None
+        # Number of successful responses since the last adjustment
+        self.nb_successes = 0
+        # Time of the last decrease
+        self.decreased_at = 0.0
+        # Download slots of the class (one per host)
+        self.slots = set()
+
+
 class DramascraperDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """
+    Downloader middleware adjusting the concurrency of each class of pages
+    (pages of the top shows, main pages of the dramas, cast tabs and lists of
+    the users) with an AIMD (additive increase, multiplicative decrease)
+    controller, each class being downloaded through its own download slot.
+
+    The concurrency of a class is increased by one after a window of
+    successful responses (as many as the current concurrency) as long as
+    their latency stays below ADAPTIVE_MAX_LATENCY. It is multiplied by
+    ADAPTIVE_DECREASE_FACTOR when the site answers 429 or 503 or when a
+    request times out. Once the concurrency is down to one, the download
+    delay is doubled instead (and halved back on success).
+    """
+    THROTTLING_STATUSES = (429, 503)
+    THROTTLING_EXCEPTIONS = (
+        error.TimeoutError, error.TCPTimedOutError,
+        error.ConnectionRefusedError, error.ConnectionLost
+    )
+    # Weight of the last response in the moving average of the latency
+    LATENCY_WEIGHT = 0.2
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start_concurrency = settings.getint("ADAPTIVE_START_CONCURRENCY",
+                                                 2)
+        self.max_concurrency = settings.getint("ADAPTIVE_MAX_CONCURRENCY", 16)
+        self.decrease_factor = settings.getfloat("ADAPTIVE_DECREASE_FACTOR",
+                                                 0.5)
+        self.max_latency = settings.getfloat("ADAPTIVE_MAX_LATENCY", 5.0)
+        self.max_delay = settings.getfloat("ADAPTIVE_MAX_DELAY", 60.0)
+        self.min_delay = settings.getfloat("DOWNLOAD_DELAY")
+        self.endpoints = {}
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        if not crawler.settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        s = cls(crawler)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
         return s
 
+    def get_endpoint(self, request):
+        """
+        Retrieving the class of the page requested
+
+        Args:
+            request (scrapy.Request): request
+
+        Returns:
+            str: class of the page. Equals to None if the url does not match
+            any class.
+        """
+        path = urlparse_cached(request).path
+        for endpoint, pattern in ENDPOINTS:
+            if pattern.match(path):
+                return endpoint
+        return None
+
+    def get_state(self, endpoint):
+        state = self.endpoints.get(endpoint)
+        if state is None:
+            state = EndpointState(self.start_concurrency, self.min_delay)
+            self.endpoints[endpoint] = state
+            self.export(endpoint, state)
+        return state
+
+    def apply(self, state):
+        """
+        Applying the concurrency and delay of a class to its download slots
+        (a slot is created by the downloader with the default values once
+        its first request went through this middleware)
+
+        Args:
+            state (EndpointState): state of the class
+        """
+        slots = self.crawler.engine.downloader.slots
+        for key in state.slots:
+            slot = slots.get(key)
+            if slot is not None:
+                slot.concurrency = state.concurrency
+                slot.delay = state.delay
+
+    def export(self, endpoint, state):
+        prefix = "adaptive/{}/".format(endpoint)
+        self.stats.set_value(prefix + "concurrency", state.concurrency)
+        self.stats.set_value(prefix + "delay", state.delay)
+        if state.latency is not None:
+            self.stats.set_value(prefix + "latency", round(state.latency, 3))
+
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        endpoint = self.get_endpoint(request)
+        if endpoint is None or "download_slot" in request.meta:
+            return None
+        state = self.get_state(endpoint)
+        key = "{}:{}".format(urlparse_cached(request).hostname, endpoint)
+        state.slots.add(key)
+        self.apply(state)
+        request.meta["download_slot"] = key
+        request.meta["adaptive_endpoint"] = endpoint
+        request.meta["adaptive_sent_at"] = time.time()
         return None
 
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+        endpoint = request.meta.get("adaptive_endpoint")
+        if endpoint is None:
+            return response
+        if response.status in self.THROTTLING_STATUSES:
+            self.decrease(endpoint, request, str(response.status))
+        else:
+            self.increase(endpoint, request.meta.get("download_latency"))
         return response
 
     def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+        endpoint = request.meta.get("adaptive_endpoint")
+        if endpoint is not None and \
+                isinstance(exception, self.THROTTLING_EXCEPTIONS):
+            self.decrease(endpoint, request, type(exception).__name__)
+        return None
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+    def increase(self, endpoint, latency):
+        """
+        Recording a successful response, and increasing the concurrency of
+        its class (or decreasing its delay) after a window of successful
+        responses whose latency stays acceptable
+
+        Args:
+            endpoint (str): class of the page
+            latency (float): download latency of the response, in seconds
+        """
+        state = self.get_state(endpoint)
+        if latency is not None:
+            if state.latency is None:
+                state.latency = latency
+            else:
+                state.latency += self.LATENCY_WEIGHT * \
+                    (latency - state.latency)
+        state.nb_successes += 1
+        if state.nb_successes < state.concurrency:
+            return
+        state.nb_successes = 0
+        prefix = "adaptive/{}/".format(endpoint)
+        if state.latency is not None and state.latency > self.max_latency:
+            self.stats.inc_value(prefix + "hold")
+        elif state.delay > self.min_delay:
+            state.delay /= 2
+            if state.delay < max(1.0, self.min_delay):
+                state.delay = self.min_delay
+            self.stats.inc_value(prefix + "increase")
+        elif state.concurrency < self.max_concurrency:
+            state.concurrency += 1
+            self.stats.inc_value(prefix + "increase")
+        self.apply(state)
+        self.export(endpoint, state)
+
+    def decrease(self, endpoint, request, reason):
+        """
+        Decreasing the concurrency of a class of pages (or increasing its
+        delay) after the site throttled one of its requests. The requests
+        sent before the previous decrease are ignored, as they were sent
+        with the previous concurrency.
+
+        Args:
+            endpoint (str): class of the page
+            request (scrapy.Request): request throttled
+            reason (str): status code or exception
+        """
+        state = self.get_state(endpoint)
+        prefix = "adaptive/{}/".format(endpoint)
+        self.stats.inc_value(prefix + "throttled/" + reason)
+        if request.meta.get("adaptive_sent_at", 0) < state.decreased_at:
+            return
+        state.decreased_at = time.time()
+        state.nb_successes = 0
+        if state.concurrency > 1:
+            state.concurrency = max(
+                1, int(state.concurrency * self.decrease_factor))
+        else:
+            state.delay = min(self.max_delay, max(1.0, state.delay * 2))
+        self.stats.inc_value(prefix + "decrease")
+        logging.info("Throttled on %s pages (%s): concurrency %d, delay %.1fs",
+                     endpoint, reason, state.concurrency, state.delay)
+        self.apply(state)
+        self.export(endpoint, state)
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class ReplayMiddleware:
+    """
+    Downloader middleware sending the requests made to MyDramaList to the
+    replay server given by the REPLAY_URL setting (python -m
+    dramascraper.replay) instead. The responses are given back the url of
+    the original request, so that the spiders scrape the same items as
+    online.
+    """
+    HOSTS = ("mydramalist.com", "www.mydramalist.com")
+
+    def __init__(self, replay_url):
+        self.replay_url = replay_url.rstrip("/")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        replay_url = crawler.settings.get("REPLAY_URL")
+        if not replay_url:
+            raise NotConfigured
+        logging.info("Requests to MyDramaList sent to %s", replay_url)
+        return cls(replay_url)
+
+    def process_request(self, request, spider):
+        if "replay_url" in request.meta or \
+                urlparse_cached(request).hostname not in self.HOSTS:
+            return None
+        url = urlparse_cached(request)
+        replay_url = self.replay_url + url.path
+        if url.query:
+            replay_url += "?" + url.query
+        meta = dict(request.meta, replay_url=request.url)
+        return request.replace(url=replay_url, meta=meta, dont_filter=True)
+
+    def process_response(self, request, response, spider):
+        original_url = request.meta.get("replay_url")
+        if original_url is None:
+            return response
+        return response.replace(url=original_url)
+
+
+class RotateUserAgentMiddleware:
+    """
+    Downloader middleware sending each request with a user agent drawn from
+    a pool held in memory : the USER_AGENTS setting if it is set, the user
+    agents bundled in dramascraper/useragents.py otherwise. A request whose
+    user agent is already set keeps it (as do its retries).
+    """
+
+    def __init__(self, user_agents):
+        self.user_agents = list(user_agents)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        user_agents = crawler.settings.getlist("USER_AGENTS") or USER_AGENTS
+        return cls(user_agents)
+
+    def process_request(self, request, spider):
+        request.headers.setdefault(b"User-Agent",
+                                   random.choice(self.user_agents))
+        return None
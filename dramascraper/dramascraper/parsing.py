@@ -0,0 +1,150 @@
+"""
+Pool of worker processes extracting the fields of the dramas' pages and of
+their cast tabs, so that the parsing of a crawl is spread over several cores
+instead of running in the thread of the reactor.
+
+Only the raw body of a page, its url and its encoding are sent to a worker,
+which builds the response again and runs the extractors of its own instance
+of the dramalist spider. The fields extracted (and their errors in tolerant
+mode) are sent back to the main process, where the items are assembled.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.http import HtmlResponse
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+
+try:
+    from scrapy.utils.defer import maybe_deferred_to_future
+except ImportError:
+    # Versions of Scrapy older than 2.7 run the coroutines of the callbacks
+    # as Deferreds, which can await the Deferreds themselves
+    def maybe_deferred_to_future(deferred):
+        return deferred
+
+# Spider whose extractors are run by the worker process
+_spider = None
+
+
+def open_pool(nb_workers, backend):
+    """
+    Starting the worker processes. They are spawned rather than forked, so
+    that they do not inherit the reactor, its threads and the open files of
+    the crawl.
+
+    Args:
+        nb_workers (int): number of processes
+        backend (str): backend building the documents of the pages
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: pool
+    """
+    return ProcessPoolExecutor(
+        nb_workers, mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker, initargs=(backend,))
+
+
+def init_worker(backend):
+    """
+    Instantiating the spider of a worker process
+
+    Args:
+        backend (str): backend building the documents of the pages
+    """
+    global _spider
+    # Imported here so that importing this module from the spider does not
+    # import the spider in turn
+    from dramascraper.spiders.dramalist import DramalistSpider
+
+    _spider = DramalistSpider()
+    _spider.parser_backend = backend
+
+
+def extract(kind, url, body, encoding, tolerant):
+    """
+    Extracting the fields of a page in a worker process
+
+    Args:
+        kind (str): 'main_tab' for a drama's page, 'cast' for its cast tab
+        url (str): url of the page
+        body (bytes): body of the page
+        encoding (str): encoding of the body
+        tolerant (bool): whether the errors of the fields are recorded
+        instead of raised
+
+    Returns:
+        tuple: fields extracted and error of each field that could not be
+        extracted (None if not tolerant)
+    """
+    response = HtmlResponse(url, body=body, encoding=encoding)
+    errors = {} if tolerant else None
+    if kind == "main_tab":
+        fields = _spider.extract_main_tab(response, errors)
+    else:
+        fields = _spider.extract_cast(response, errors)
+
+    return fields, errors
+
+
+def submit(pool, kind, response, tolerant):
+    """
+    Sending a page to a worker process
+
+    Args:
+        pool (concurrent.futures.ProcessPoolExecutor): pool
+        kind (str): 'main_tab' for a drama's page, 'cast' for its cast tab
+        response (scrapy.http.response): page
+        tolerant (bool): whether the errors of the fields are recorded
+        instead of raised
+
+    Returns:
+        twisted.internet.defer.Deferred: Deferred fired in the thread of the
+        reactor with the fields extracted and their errors
+    """
+    # Imported here so that the reactor chosen by Scrapy is installed first
+    from twisted.internet import reactor
+
+    deferred = Deferred()
+    future = pool.submit(extract, kind, response.url, response.body,
+                         response.encoding, tolerant)
+    # The callbacks of the future run in a thread of the pool
+    future.add_done_callback(
+        lambda future: reactor.callFromThread(fire, deferred, future))
+
+    return deferred
+
+
+async def run(pool, kind, response, tolerant):
+    """
+    Extracting the fields of a page in a worker process, from a coroutine
+    running in the thread of the reactor
+
+    Args:
+        pool (concurrent.futures.ProcessPoolExecutor): pool
+        kind (str): 'main_tab' for a drama's page, 'cast' for its cast tab
+        response (scrapy.http.response): page
+        tolerant (bool): whether the errors of the fields are recorded
+        instead of raised
+
+    Returns:
+        tuple: fields extracted and error of each field that could not be
+        extracted (None if not tolerant)
+    """
+    return await maybe_deferred_to_future(
+        submit(pool, kind, response, tolerant))
+
+
+def fire(deferred, future):
+    """
+    Firing a Deferred with the result of a future of the pool
+
+    Args:
+        deferred (twisted.internet.defer.Deferred): Deferred
+        future (concurrent.futures.Future): completed future
+    """
+    exception = future.exception()
+    if exception is not None:
+        deferred.errback(Failure(exception))
+    else:
+        deferred.callback(future.result())
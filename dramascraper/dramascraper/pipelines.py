@@ -4,32 +4,130 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 
+import hashlib
 import json
+import logging
 import os
+import time
+from array import array
+from collections import defaultdict
 
-import mysql.connector
 from dotenv import load_dotenv
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from scrapy.exceptions import NotConfigured
+from twisted.enterprise import adbapi
+from twisted.internet import defer, task
+
+from dramascraper import markup, sparse
+from dramascraper.storage import DramaRecords
 
 
 class InsertItem:
+    """
+    Pipeline inserting the dramas in a MySQL database. The rows are buffered
+    and inserted by batches of MYSQL_BATCH_SIZE rows (or every
+    MYSQL_FLUSH_INTERVAL seconds) through a pool of connections whose queries
+    run in threads, so that the database never blocks the downloads.
+
+    The rows are upserted on the mydramalisturl column (which must be a
+    unique key) and a hash of each row is stored in the row_hash column, so
+    that the dramas that did not change since the last crawl are not written
+    again.
+    """
+    COLUMNS = (
+        "name", "synopsis", "duration", "nb_episodes", "country", "rating",
+        "ranking", "popularity_rank", "nb_watchers", "nb_ratings",
+        "nb_reviews", "streamed_on", "genres", "tags", "mydramalisturl",
+        "mydramalist_id", "screenwriter", "director", "mainroles",
+        "supportingroles", "guestroles", "row_hash"
+    )
+    # Fields of the items that are not stored in the drama table (the errors
+    # of the fields that could not be extracted in tolerant mode)
+    EXCLUDED_FIELDS = ("field_errors",)
+    # MySQL error raised when a transaction is rolled back to break a
+    # deadlock, and number of times a batch is then written again
+    DEADLOCK_ERROR = 1213
+    DEADLOCK_RETRIES = 3
+    QUERY = "INSERT INTO drama ({}) VALUES ({}) ON DUPLICATE KEY UPDATE {}" \
+        .format(
+            ", ".join(COLUMNS),
+            ", ".join(["%s"] * len(COLUMNS)),
+            ", ".join("{0} = VALUES({0})".format(column)
+                      for column in COLUMNS if column != "mydramalisturl")
+        )
 
-    def __init__(self):
+    def __init__(self, batch_size=500, flush_interval=5, pool_size=3,
+                 stats=None):
         load_dotenv()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pool_size = pool_size
+        self.stats = stats
+        self.rows = []
+        self.pending = []
+        # Hash of the row of each drama stored in the database
+        self.hashes = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            batch_size=crawler.settings.getint("MYSQL_BATCH_SIZE", 500),
+            flush_interval=crawler.settings.getfloat(
+                "MYSQL_FLUSH_INTERVAL", 5),
+            pool_size=crawler.settings.getint("MYSQL_POOL_SIZE", 3),
+            stats=crawler.stats
+        )
+
+    def open_spider(self, spider):
+        """
+        Method called when the spider is opened. The connections to the
+        database are only created if the insertion is enabled.
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            twisted.internet.defer.Deferred: fired once the hashes of the
+            rows stored in the database are loaded
+        """
+        if not self.is_enabled(spider):
+            return None
         self.db_connection()
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+        d = self.dbpool.runQuery(
+            "SELECT mydramalisturl, row_hash FROM drama")
+        d.addCallback(lambda rows: self.hashes.update(rows))
+
+        return d
+
+    def is_enabled(self, spider):
+        """
+        Checking whether the insertion was asked when launching the spider
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            bool: True if the items have to be inserted
+        """
+        return getattr(spider, "sql", False)
 
     def db_connection(self):
         """
-        Create a connection to the database
+        Create a pool of connections to the database
         """
-        self.db = mysql.connector.connect(
+        self.dbpool = adbapi.ConnectionPool(
+            "mysql.connector",
             host=os.getenv("HOST"),
             user=os.getenv("USERNAME"),
             passwd=os.getenv("PASSWORD"),
-            database=os.getenv("DB")
+            database=os.getenv("DB"),
+            cp_min=1,
+            cp_max=self.pool_size,
+            cp_reconnect=True
         )
-        self.cursor = self.db.cursor(dictionary=True)
 
     def convert_to_json_string(self, item):
         """
@@ -41,11 +139,109 @@ class InsertItem:
         Returns:
             dict: Informations about a drama with JSON strings
         """
-        for key in item:
-            if isinstance(item[key], list):
-                item[key] = json.dumps(item[key])
+        return {
+            key: json.dumps(value) if isinstance(value, list) else value
+            for key, value in ItemAdapter(item).items()
+            if key not in self.EXCLUDED_FIELDS
+        }
 
-        return item
+    def get_row(self, item):
+        """
+        Building the row of a drama, with the hash of its values as last value
+
+        Args:
+            item (dict): item returned by our Scrapy spider
+
+        Returns:
+            tuple: values of the row
+        """
+        values = tuple(self.convert_to_json_string(item).values())
+        row_hash = hashlib.sha1(json.dumps(values).encode("utf-8"))
+
+        return values + (row_hash.hexdigest(),)
+
+    def insert_rows(self, cursor, rows):
+        """
+        Inserting a batch of rows. This method runs in a thread of the pool
+        which commits the transaction once it returns.
+
+        Args:
+            cursor: cursor of one of the connections of the pool
+            rows (list): list of tuples of values
+        """
+        cursor.executemany(self.QUERY, rows)
+
+    def flush(self):
+        """
+        Sending the buffered rows to the pool of connections
+
+        Returns:
+            twisted.internet.defer.Deferred: fired once the rows are inserted
+        """
+        if not self.rows:
+            return defer.succeed(None)
+        rows, self.rows = self.rows, []
+        d = self.write_rows(rows, self.DEADLOCK_RETRIES)
+        d.addCallbacks(self.rows_inserted, self.insert_failed,
+                       callbackArgs=(rows,), errbackArgs=(rows,))
+        self.pending.append(d)
+        d.addBoth(lambda _: self.pending.remove(d))
+
+        return d
+
+    def write_rows(self, rows, nb_retries):
+        """
+        Inserting a batch of rows in a transaction, which is run again when
+        it was rolled back to break a deadlock with another one
+
+        Args:
+            rows (list): rows of the batch
+            nb_retries (int): number of times the transaction can be run again
+
+        Returns:
+            twisted.internet.defer.Deferred: fired with the result of
+            insert_rows once the transaction is committed
+        """
+        d = self.dbpool.runInteraction(self.insert_rows, rows)
+
+        def retry(failure):
+            if nb_retries <= 0 or \
+                    getattr(failure.value, "errno", None) != \
+                    self.DEADLOCK_ERROR:
+                return failure
+            if self.stats is not None:
+                self.stats.inc_value("mysql/deadlock_retries")
+            return self.write_rows(rows, nb_retries - 1)
+
+        return d.addErrback(retry)
+
+    def rows_inserted(self, result, rows):
+        """
+        Method called once a batch of rows is inserted, which records their
+        hashes so that the dramas are skipped while they do not change
+
+        Args:
+            result: value returned by insert_rows
+            rows (list): list of tuples of values
+        """
+        url_index = self.COLUMNS.index("mydramalisturl")
+        for row in rows:
+            self.hashes[row[url_index]] = row[-1]
+
+    def insert_failed(self, failure, rows):
+        """
+        Method called when the insertion of a batch of rows failed, which is
+        counted in the stats (mysql/failed)
+
+        Args:
+            failure (twisted.python.failure.Failure): error of the insertion
+            rows (list): rows of the batch
+        """
+        logging.error("Insertion of %d rows failed: %s", len(rows),
+                      failure.value)
+        if self.stats is not None:
+            self.stats.inc_value("mysql/failed")
+            self.stats.inc_value("mysql/failed_rows", len(rows))
 
     def process_item(self, item, spider):
         """
@@ -55,15 +251,639 @@ class InsertItem:
         Args:
             item (dict): item returned by our Scrapy spider
             spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            dict: item returned by our Scrapy spider
+        """
+        if self.is_enabled(spider):
+            row = self.get_row(item)
+            url = ItemAdapter(item)["mydramalist_url"]
+            if self.hashes.get(url) == row[-1]:
+                if self.stats is not None:
+                    self.stats.inc_value("mysql/unchanged")
+                return item
+            self.rows.append(row)
+            if len(self.rows) >= self.batch_size:
+                self.flush()
+
+        return item
+
+    def close_spider(self, spider):
+        """
+        Method called when the spider is closed, which inserts the remaining
+        rows and waits for the insertions to finish
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            twisted.internet.defer.Deferred: fired once every row is inserted
+        """
+        if not self.is_enabled(spider):
+            return None
+        self.flush_loop.stop()
+        self.flush()
+        d = defer.DeferredList(list(self.pending))
+        d.addBoth(lambda _: self.dbpool.close())
+
+        return d
+
+
+class NormalizedInsertItem(InsertItem):
+    """
+    Pipeline inserting the genres, tags, platforms and people of the dramas
+    in normalized tables, linked to the dramas by indexed join tables. The
+    rows are bulk loaded by batches of MYSQL_BATCH_SIZE dramas.
+
+    The ids of the genres, tags, platforms and people are assigned by the
+    database, their name being a unique key, and read back once the new
+    names are inserted, so that several crawls can write in the same tables.
+    The ids already known are kept in memory once their transaction is
+    committed, so that each name is only inserted once per crawl. The names
+    and the dramas are written in a sorted order, so that the transactions
+    of the pool lock the rows in the same order.
+
+    The dramas are identified by their numeric id on MyDramaList, stored in
+    the mydramalist_id column of the drama table.
+    """
+    ENTITY_TABLES = ("genre", "tag", "platform", "person")
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS {} (id INT AUTO_INCREMENT PRIMARY KEY, "
+        "name VARCHAR(255) NOT NULL, UNIQUE KEY (name))".format(table)
+        for table in ENTITY_TABLES
+    ] + [
+        "CREATE TABLE IF NOT EXISTS drama_{0} (drama_id INT NOT NULL, "
+        "{0}_id INT NOT NULL, PRIMARY KEY (drama_id, {0}_id), "
+        "KEY ({0}_id))".format(table)
+        for table in ("genre", "tag", "platform")
+    ] + [
+        "CREATE TABLE IF NOT EXISTS drama_person (drama_id INT NOT NULL, "
+        "person_id INT NOT NULL, role VARCHAR(16) NOT NULL, "
+        "PRIMARY KEY (drama_id, person_id, role), KEY (person_id, role))"
+    ]
+    # Table storing the values of each list field of the items, and join
+    # table linking them to the dramas
+    ENTITIES = {
+        "streamed_on": ("platform", "drama_platform"),
+        "genres": ("genre", "drama_genre"),
+        "tags": ("tag", "drama_tag"),
+        "screenwriter": ("person", "drama_person"),
+        "director": ("person", "drama_person"),
+        "main_roles": ("person", "drama_person"),
+        "support_roles": ("person", "drama_person"),
+        "guest_roles": ("person", "drama_person"),
+    }
+    JOIN_QUERIES = {
+        "drama_platform": "INSERT IGNORE INTO drama_platform "
+                          "(drama_id, platform_id) VALUES (%s, %s)",
+        "drama_genre": "INSERT IGNORE INTO drama_genre "
+                       "(drama_id, genre_id) VALUES (%s, %s)",
+        "drama_tag": "INSERT IGNORE INTO drama_tag "
+                     "(drama_id, tag_id) VALUES (%s, %s)",
+        "drama_person": "INSERT IGNORE INTO drama_person "
+                        "(drama_id, person_id, role) VALUES (%s, %s, %s)",
+    }
+    ENTITY_QUERY = "INSERT IGNORE INTO {} (name) VALUES (%s)"
+    ID_QUERY = "SELECT id, name FROM {} WHERE name IN ({})"
+    # Query returning the id of a single name through LAST_INSERT_ID(),
+    # whether it has just been inserted or not
+    UPSERT_QUERY = "INSERT INTO {} (name) VALUES (%s) " \
+                   "ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)"
+    # Number of names whose ids are read back by query
+    ID_CHUNK_SIZE = 1000
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # Id of each name already inserted, by table
+        self.ids = defaultdict(dict)
+
+    def is_enabled(self, spider):
+        return getattr(spider, "normalized", False)
+
+    def open_spider(self, spider):
+        """
+        Method called when the spider is opened, which creates the tables and
+        loads the ids of the names already inserted
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            twisted.internet.defer.Deferred: fired once the ids are loaded
+        """
+        if not self.is_enabled(spider):
+            return None
+        self.db_connection()
+        self.flush_loop = task.LoopingCall(self.flush)
+        self.flush_loop.start(self.flush_interval, now=False)
+
+        return self.dbpool.runInteraction(self.load_ids)
+
+    def load_ids(self, cursor):
+        """
+        Creating the tables if needed and loading the ids of the genres,
+        tags, platforms and people already inserted
+
+        Args:
+            cursor: cursor of one of the connections of the pool
+        """
+        for query in self.SCHEMA:
+            cursor.execute(query)
+        for table in self.ENTITY_TABLES:
+            cursor.execute("SELECT id, name FROM {}".format(table))
+            for entity_id, name in cursor.fetchall():
+                self.ids[table][name] = entity_id
+
+    def resolve_ids(self, cursor, table, names):
+        """
+        Inserting the names whose id is not known yet and reading back the
+        ids assigned by the database
+
+        Args:
+            cursor: cursor of one of the connections of the pool
+            table (str): table storing the names
+            names (set): names of genres, tags, platforms or people
+
+        Returns:
+            dict: id of each name whose id was not known, by name
+        """
+        known = {}
+        names = sorted(name for name in names if name not in self.ids[table])
+        if not names:
+            return known
+        cursor.executemany(self.ENTITY_QUERY.format(table),
+                           [(name,) for name in names])
+        for start in range(0, len(names), self.ID_CHUNK_SIZE):
+            chunk = names[start:start + self.ID_CHUNK_SIZE]
+            cursor.execute(
+                self.ID_QUERY.format(table, ", ".join(["%s"] * len(chunk))),
+                chunk
+            )
+            for entity_id, name in cursor.fetchall():
+                known[name] = entity_id
+        # A name equal to another one for the collation of the table (e.g.
+        # differing by its case) is not read back, as its row stores the
+        # other one
+        for name in names:
+            if name not in known:
+                cursor.execute(self.UPSERT_QUERY.format(table), (name,))
+                known[name] = cursor.lastrowid
+
+        return known
+
+    def insert_rows(self, cursor, rows):
+        """
+        Inserting the new names and replacing the rows of the join tables of
+        a batch of dramas. This method runs in a thread of the pool which
+        commits the transaction once it returns.
+
+        Args:
+            cursor: cursor of one of the connections of the pool
+            rows (list): list of (drama id, entities) tuples, the entities
+            being (table, join table, name, role) tuples
+
+        Returns:
+            dict: ids of the new names, by table, which are only kept once
+            the transaction is committed
+        """
+        drama_ids = set()
+        names = defaultdict(set)
+        for drama_id, entities in rows:
+            drama_ids.add(drama_id)
+            for table, _, name, _ in entities:
+                names[table].add(name)
+        new_ids = {}
+        for table in sorted(names):
+            new_ids[table] = self.resolve_ids(cursor, table, names[table])
+
+        joins = defaultdict(set)
+        for drama_id, entities in rows:
+            for table, join_table, name, role in entities:
+                entity_id = new_ids[table].get(name)
+                if entity_id is None:
+                    entity_id = self.ids[table][name]
+                values = (drama_id, entity_id)
+                if role is not None:
+                    values += (role,)
+                joins[join_table].add(values)
+        drama_ids = sorted(drama_ids)
+        placeholders = ", ".join(["%s"] * len(drama_ids))
+        for table in sorted(self.JOIN_QUERIES):
+            cursor.execute(
+                "DELETE FROM {} WHERE drama_id IN ({})".format(
+                    table, placeholders),
+                drama_ids
+            )
+        for table in sorted(joins):
+            cursor.executemany(self.JOIN_QUERIES[table], sorted(joins[table]))
+
+        return new_ids
+
+    def rows_inserted(self, result, rows):
+        """
+        Method called once a batch of rows is inserted, which keeps the ids
+        of its new names (the rows of the normalized tables have no hash)
+
+        Args:
+            result (dict): ids of the new names, by table
+            rows (list): rows of the batch
+        """
+        for table, ids in result.items():
+            self.ids[table].update(ids)
+
+    def process_item(self, item, spider):
+        """
+        Method that is performed on each item returned by our spider and which
+        buffers the rows of the normalized tables
+
+        Args:
+            item (dict): item returned by our Scrapy spider
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            dict: item returned by our Scrapy spider
+        """
+        if not self.is_enabled(spider):
+            return item
+        adapter = ItemAdapter(item)
+        drama_id = adapter.get("mydramalist_id")
+        if drama_id is None:
+            url = adapter["mydramalist_url"]
+            drama_id = int(markup.PATTERNS["drama_id"].search(url).group(1))
+        entities = []
+        for field, (table, join_table) in self.ENTITIES.items():
+            role = field if table == "person" else None
+            for name in adapter.get(field) or []:
+                entities.append((table, join_table, name, role))
+        self.rows.append((drama_id, entities))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+        return item
+
+
+class ParquetExport:
+    """
+    Pipeline streaming the items into Parquet files (one per crawl, located
+    in the PARQUET_EXPORT_DIR directory). The values are accumulated by
+    column and written as a row group every PARQUET_ROW_GROUP_SIZE items, so
+    that the memory used does not depend on the size of the crawl. The list
+    fields are stored as native list columns.
+
+    This pipeline requires the pyarrow package.
+    """
+    # Columns of the files written for each spider, with their type
+    COLUMNS = {
+        "dramalist": [
+            ("name", "string"), ("synopsis", "string"),
+            ("duration_in_minutes", "int"), ("nb_episodes", "int"),
+            ("country_origin", "string"), ("ratings", "float"),
+            ("ranking", "int"), ("popularity_rank", "int"),
+            ("nb_watchers", "int"), ("nb_ratings", "int"),
+            ("nb_reviews", "int"), ("streamed_on", "list"),
+            ("genres", "list"), ("tags", "list"),
+            ("mydramalist_url", "string"), ("mydramalist_id", "int"),
+            ("screenwriter", "list"),
+            ("director", "list"), ("main_roles", "list"),
+            ("support_roles", "list"), ("guest_roles", "list"),
+        ],
+        "userdramalist": [
+            ("title", "string"), ("mydramalist_id", "int"), ("score", "int"),
+            ("user", "string"), ("status", "string"),
+        ],
+    }
+
+    def __init__(self, directory, row_group_size=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise NotConfigured("The pyarrow package is required to export "
+                                "the items in Parquet files")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.directory = directory
+        self.row_group_size = row_group_size
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get("PARQUET_EXPORT_DIR")
+        if not directory:
+            raise NotConfigured("PARQUET_EXPORT_DIR is not set")
+
+        return cls(directory, crawler.settings.getint(
+            "PARQUET_ROW_GROUP_SIZE", 10000))
+
+    def open_spider(self, spider):
+        """
+        Method called when the spider is opened, which creates the Parquet
+        file of the crawl
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+        """
+        types = {
+            "string": self.pa.string(),
+            "int": self.pa.int64(),
+            "float": self.pa.float64(),
+            "list": self.pa.list_(self.pa.string()),
+        }
+        self.schema = self.pa.schema([
+            (name, types[column_type])
+            for name, column_type in self.COLUMNS[spider.name]
+        ])
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, "{}-{}.parquet".format(
+            spider.name, time.strftime("%Y%m%d-%H%M%S")))
+        self.writer = self.pq.ParquetWriter(self.path, self.schema)
+        self.columns = {name: [] for name in self.schema.names}
+        self.nb_rows = 0
+
+    def write_row_group(self):
+        """
+        Writing the accumulated values as a row group of the file
+        """
+        if not self.nb_rows:
+            return
+        arrays = [
+            self.pa.array(self.columns[field.name], type=field.type)
+            for field in self.schema
+        ]
+        batch = self.pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        self.writer.write_batch(batch, row_group_size=self.nb_rows)
+        self.columns = {name: [] for name in self.schema.names}
+        self.nb_rows = 0
+
+    def process_item(self, item, spider):
+        """
+        Method that is performed on each item returned by our spider and which
+        adds its values to the columns of the current row group
+
+        Args:
+            item (dict): item returned by our Scrapy spider
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            dict: item returned by our Scrapy spider
+        """
+        adapter = ItemAdapter(item)
+        for name, values in self.columns.items():
+            values.append(adapter.get(name))
+        self.nb_rows += 1
+        if self.nb_rows >= self.row_group_size:
+            self.write_row_group()
+
+        return item
+
+    def close_spider(self, spider):
+        """
+        Method called when the spider is closed, which writes the last row
+        group and closes the file
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+        """
+        self.write_row_group()
+        self.writer.close()
+        logging.info("Items exported in %s", self.path)
+
+
+class RatingMatrix:
+    """
+    Pipeline building the matrix of the scores given by the users to the
+    dramas from the items of the userdramalist spider, in a directory of
+    RATING_MATRIX_DIR (one per crawl). The users and the dramas are interned
+    into integer ids, and the (user, drama, score) triplets are accumulated
+    in arrays written on disk every RATING_MATRIX_BUFFER_SIZE scores, so
+    that the memory used does not depend on the number of scores.
+
+    Once the crawl is over, the directory holds the matrix in the COO
+    (rows.npy, cols.npy, values.npy) and CSR (indptr.npy, indices.npy,
+    data.npy) formats, which can be memory-mapped by NumPy, the name of each
+    user (users.json) and the MyDramaList id and title of each drama
+    (dramas.json) by id, and the shape of the matrix (matrix.json). The
+    dramas are identified by their MyDramaList id, or by their title when
+    it is unknown. The rows without score (e.g. the dramas a user plans to
+    watch) are skipped, and a drama scored several times by a user (e.g.
+    listed under two statuses) keeps its last score.
+    """
+    # Files of the COO matrix, with the type code of their values
+    COO_FILES = (("rows.npy", "i"), ("cols.npy", "i"), ("values.npy", "f"))
+
+    def __init__(self, directory, buffer_size=1000000, stats=None):
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get("RATING_MATRIX_DIR")
+        if not directory:
+            raise NotConfigured("RATING_MATRIX_DIR is not set")
+
+        return cls(directory, crawler.settings.getint(
+            "RATING_MATRIX_BUFFER_SIZE", 1000000), stats=crawler.stats)
+
+    def is_enabled(self, spider):
+        return spider.name == "userdramalist"
+
+    def open_spider(self, spider):
+        """
+        Method called when the spider is opened, which creates the directory
+        of the matrix and the files of the COO matrix
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+        """
+        if not self.is_enabled(spider):
+            return
+        self.path = os.path.join(self.directory, "ratings-{}".format(
+            time.strftime("%Y%m%d-%H%M%S")))
+        os.makedirs(self.path, exist_ok=True)
+        self.files = [
+            sparse.NpyFile(os.path.join(self.path, name), typecode)
+            for name, typecode in self.COO_FILES
+        ]
+        self.buffers = [array(typecode) for _, typecode in self.COO_FILES]
+        # Id of each user and drama (keyed by the MyDramaList id of the drama
+        # or by its title), title of each drama and number of scores of each
+        # user
+        self.users = {}
+        self.dramas = {}
+        self.titles = []
+        self.counts = array("q")
+
+    def get_id(self, ids, key):
+        """
+        Retrieving the id of a user or of a drama, a new one being given to
+        the ones seen for the first time
+
+        Args:
+            ids (dict): id by key
+            key (str or int): name of the user, MyDramaList id or title of
+            the drama
+
+        Returns:
+            int: id
+        """
+        value = ids.get(key)
+        if value is None:
+            value = ids[key] = len(ids)
+
+        return value
+
+    def write_buffers(self):
+        """
+        Appending the accumulated triplets to the files of the COO matrix
+        """
+        for f, buffer in zip(self.files, self.buffers):
+            f.write(buffer)
+            del buffer[:]
+
+    def process_item(self, item, spider):
+        """
+        Method that is performed on each item returned by our spider and which
+        adds its score to the matrix
+
+        Args:
+            item (dict): item returned by our Scrapy spider
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            dict: item returned by our Scrapy spider
+        """
+        if not self.is_enabled(spider):
+            return item
+        adapter = ItemAdapter(item)
+        if adapter.get("score") is None or adapter.get("title") is None:
+            return item
+        user = self.get_id(self.users, adapter["user"])
+        if user == len(self.counts):
+            self.counts.append(0)
+        self.counts[user] += 1
+        rows, cols, values = self.buffers
+        rows.append(user)
+        drama = adapter.get("mydramalist_id")
+        if drama is None:
+            drama = adapter["title"]
+        col = self.get_id(self.dramas, drama)
+        if col == len(self.titles):
+            self.titles.append(adapter["title"])
+        cols.append(col)
+        values.append(adapter["score"])
+        if len(rows) >= self.buffer_size:
+            self.write_buffers()
+
+        return item
+
+    def write_ids(self, name, ids):
+        """
+        Writing the keys of the ids in a JSON list, where the index of each
+        key is its id
+
+        Args:
+            name (str): name of the file
+            ids (dict): id by key
+        """
+        keys = [None] * len(ids)
+        for key, value in ids.items():
+            keys[value] = key
+        with open(os.path.join(self.path, name), "w", encoding="utf-8") as f:
+            json.dump(keys, f, ensure_ascii=False)
+
+    def close_spider(self, spider):
+        """
+        Method called when the spider is closed, which completes the COO
+        matrix, builds the CSR matrix from it (merging the duplicate scores)
+        and writes the ids
+
+        Args:
+            spider (scrapy.Spider): Scrapy spider object
+        """
+        if not self.is_enabled(spider):
+            return
+        self.write_buffers()
+        for f in self.files:
+            f.close()
+        paths = [f.path for f in self.files]
+        nb_scores = sparse.build_csr(*paths, self.counts, self.path)
+        self.write_ids("users.json", self.users)
+        self.write_ids("dramas.json", {
+            (key if isinstance(key, int) else None, self.titles[value]): value
+            for key, value in self.dramas.items()
+        })
+        with open(os.path.join(self.path, "matrix.json"), "w") as f:
+            json.dump({"shape": [len(self.users), len(self.dramas)],
+                       "nb_scores": nb_scores}, f)
+        if self.stats is not None:
+            self.stats.set_value("rating_matrix/scores", nb_scores)
+            self.stats.set_value("rating_matrix/duplicates",
+                                 self.files[0].length - nb_scores)
+        logging.info("Matrix of %d scores (%d users, %d dramas) written in "
+                     "%s", nb_scores, len(self.users), len(self.dramas),
+                     self.path)
+
+
+class JoinDramas:
+    """
+    Pipeline joining the rows of the users' lists to the records of the
+    dramas by their MyDramaList id, rather than by their title. The dramas
+    scraped by the dramalist spider are stored in the DRAMA_RECORDS_PATH
+    SQLite file, and each item of the userdramalist spider is given the
+    record of its drama in its 'drama' field (None if the drama has not been
+    scraped).
+    """
+
+    def __init__(self, path, cache_size=10000, stats=None):
+        self.path = path
+        self.cache_size = cache_size
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("DRAMA_RECORDS_PATH")
+        if not path:
+            raise NotConfigured("DRAMA_RECORDS_PATH is not set")
+
+        return cls(path, crawler.settings.getint(
+            "DRAMA_RECORDS_CACHE_SIZE", 10000), stats=crawler.stats)
+
+    def open_spider(self, spider):
+        self.records = DramaRecords(self.path, self.cache_size)
+
+    def process_item(self, item, spider):
+        """
+        Method that is performed on each item returned by our spider and which
+        stores the record of a drama or joins it to a row of a user's list
+
+        Args:
+            item (dict): item returned by our Scrapy spider
+            spider (scrapy.Spider): Scrapy spider object
+
+        Returns:
+            dict: item returned by our Scrapy spider
         """
-        if spider.sql:
-            query = "INSERT INTO drama (name, synopsis, duration, nb_episodes, " \
-                    "country, rating, ranking, popularity_rank, nb_watchers, " \
-                    "nb_ratings, nb_reviews, streamed_on, genres, tags, " \
-                    "mydramalisturl, screenwriter, director, mainroles, " \
-                    "supportingroles, guestroles) VALUES (%s, %s, %s, %s, %s, " \
-                    "%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
-            item = self.convert_to_json_string(item)
-            values = tuple(item.values())
-            self.cursor.execute(query, values)
-            self.db.commit()
\ No newline at end of file
+        adapter = ItemAdapter(item)
+        drama_id = adapter.get("mydramalist_id")
+        if spider.name == "dramalist":
+            # The partial records of the tolerant mode are not stored, and
+            # the id of a drama is the key of its record
+            if drama_id is not None and not adapter.get("field_errors"):
+                self.records.set(drama_id, {
+                    key: value for key, value in adapter.items()
+                    if key not in InsertItem.EXCLUDED_FIELDS and
+                    key != "mydramalist_id"
+                })
+        elif spider.name == "userdramalist":
+            record = None
+            if drama_id is not None:
+                record = self.records.get(drama_id)
+            if self.stats is not None:
+                self.stats.inc_value("join/{}".format(
+                    "found" if record is not None else "missing"))
+            adapter["drama"] = record
+
+        return item
+
+    def close_spider(self, spider):
+        self.records.close()
@@ -0,0 +1,279 @@
+"""
+Recording and replaying the responses of MyDramaList, so that the spiders
+can be run and benchmarked offline.
+
+The responses are recorded by the ReplayCacheStorage, a storage of the HTTP
+cache of Scrapy (HTTPCACHE_STORAGE). Their bodies are compressed and
+addressed by their content, so that identical pages are stored once, and an
+index keyed by the path of the urls is stored in a SQLite file for each
+spider.
+
+The recorded responses can be read back by the HTTP cache, at full speed, or
+served by a local stand-in of MyDramaList, at a configurable latency :
+
+    python -m dramascraper.replay --directory .scrapy/httpcache --latency 0.2
+
+the requests of the spiders being sent to it when the REPLAY_URL setting is
+set.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+
+INDEX_NAME = "index.sqlite3"
+OBJECTS_NAME = "objects"
+
+
+def get_key(url):
+    """
+    Computing the key of a url in the index, which does not depend on the
+    host so that the responses can be served by another one
+
+    Args:
+        url (str): url
+
+    Returns:
+        str: path and query of the url
+    """
+    parts = urlsplit(url)
+    key = parts.path or "/"
+    if parts.query:
+        key += "?" + parts.query
+
+    return key
+
+
+def get_object_path(directory, digest):
+    return os.path.join(directory, OBJECTS_NAME, digest[:2], digest + ".gz")
+
+
+def open_index(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        "key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, "
+        "headers TEXT NOT NULL, body_sha1 TEXT NOT NULL, "
+        "stored_at REAL NOT NULL)"
+    )
+
+    return connection
+
+
+class ReplayCacheStorage:
+    """
+    Storage of the HTTP cache recording the responses in
+    <HTTPCACHE_DIR>/<spider>, their bodies being compressed with gzip and
+    stored once per content. Only GET requests are recorded, as the key of a
+    response is the path of its url.
+    """
+    # Number of responses after which the index is saved in the file
+    COMMIT_EVERY = 100
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"])
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.nb_pending = 0
+
+    def open_spider(self, spider):
+        self.directory = os.path.join(self.cachedir, spider.name)
+        os.makedirs(self.directory, exist_ok=True)
+        self.connection = open_index(os.path.join(self.directory, INDEX_NAME))
+
+    def close_spider(self, spider):
+        self.connection.commit()
+        self.connection.close()
+
+    def retrieve_response(self, spider, request):
+        """
+        Retrieving the recorded response to a request
+
+        Args:
+            spider (scrapy.Spider): spider
+            request (scrapy.Request): request
+
+        Returns:
+            scrapy.http.Response: recorded response. Equals to None if it has
+            not been recorded or if it expired.
+        """
+        if request.method != "GET":
+            return None
+        row = self.connection.execute(
+            "SELECT status, headers, body_sha1, stored_at FROM responses "
+            "WHERE key = ?", (get_key(request.url),)
+        ).fetchone()
+        if row is None:
+            return None
+        status, headers, digest, stored_at = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None
+        with gzip.open(get_object_path(self.directory, digest), "rb") as f:
+            body = f.read()
+        headers = Headers(json.loads(headers))
+        respcls = responsetypes.from_args(headers=headers, url=request.url,
+                                          body=body)
+
+        return respcls(url=request.url, headers=headers, status=status,
+                       body=body)
+
+    def store_response(self, spider, request, response):
+        """
+        Recording the response to a request. Its body is written only if no
+        other response had the same content.
+
+        Args:
+            spider (scrapy.Spider): spider
+            request (scrapy.Request): request
+            response (scrapy.http.Response): response
+        """
+        if request.method != "GET":
+            return
+        digest = hashlib.sha1(response.body).hexdigest()
+        path = get_object_path(self.directory, digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written in a temporary file first so that a killed crawl never
+            # leaves a truncated object behind
+            with gzip.open(path + ".tmp", "wb") as f:
+                f.write(response.body)
+            os.replace(path + ".tmp", path)
+        headers = {
+            name.decode("latin-1"): [value.decode("latin-1")
+                                     for value in values]
+            for name, values in response.headers.items()
+        }
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (get_key(request.url), request.url, response.status,
+             json.dumps(headers), digest, time.time())
+        )
+        self.nb_pending += 1
+        if self.nb_pending >= self.COMMIT_EVERY:
+            self.connection.commit()
+            self.nb_pending = 0
+
+
+class ReplayIndex:
+    """
+    Responses recorded by the spiders, loaded in memory from the index of
+    every spider found in a directory of the HTTP cache
+    """
+
+    def __init__(self, cachedir):
+        # Status, headers and path of the body, by key
+        self.responses = {}
+        for name in sorted(os.listdir(cachedir)):
+            directory = os.path.join(cachedir, name)
+            path = os.path.join(directory, INDEX_NAME)
+            if not os.path.exists(path):
+                continue
+            connection = open_index(path)
+            rows = connection.execute(
+                "SELECT key, status, headers, body_sha1 FROM responses")
+            for key, status, headers, digest in rows:
+                self.responses[key] = (
+                    status, json.loads(headers),
+                    get_object_path(directory, digest)
+                )
+            connection.close()
+
+    def __len__(self):
+        return len(self.responses)
+
+    def get(self, url):
+        return self.responses.get(get_key(url))
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """
+    Handler serving the recorded responses, after waiting for the latency of
+    the server
+    """
+    # Headers recomputed by the server
+    SKIPPED_HEADERS = {"content-length", "transfer-encoding", "connection",
+                       "date", "server"}
+
+    def do_GET(self):
+        server = self.server
+        if server.latency or server.jitter:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+        recorded = server.index.get(self.path)
+        if recorded is None:
+            self.send_error(404, "Not recorded")
+            return
+        status, headers, path = recorded
+        with gzip.open(path, "rb") as f:
+            body = f.read()
+        self.send_response(status)
+        for name, values in headers.items():
+            if name.lower() in self.SKIPPED_HEADERS:
+                continue
+            for value in values:
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(cachedir, host="127.0.0.1", port=8080, latency=0.0, jitter=0.0,
+          verbose=False):
+    """
+    Serving the recorded responses until the process is interrupted
+
+    Args:
+        cachedir (str): directory of the HTTP cache (HTTPCACHE_DIR)
+        host (str): address the server listens on
+        port (int): port the server listens on
+        latency (float): time (in seconds) waited before each response
+        jitter (float): maximum random time (in seconds) added to the latency
+        verbose (bool): True to log every request
+    """
+    server = ThreadingHTTPServer((host, port), ReplayHandler)
+    server.daemon_threads = True
+    server.index = ReplayIndex(cachedir)
+    server.latency = latency
+    server.jitter = jitter
+    server.verbose = verbose
+    print("Serving {} responses on http://{}:{}".format(
+        len(server.index), host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve the responses recorded by the ReplayCacheStorage")
+    parser.add_argument("--directory", default=".scrapy/httpcache",
+                        help="directory of the HTTP cache (HTTPCACHE_DIR)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds waited before each response")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="maximum random seconds added to the latency")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    serve(args.directory, args.host, args.port, args.latency, args.jitter,
+          args.verbose)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Sources the urls of the dramas can be seeded from instead of the pages of
+the top shows : sitemaps, files of urls and ranges of ids.
+
+Every source is read lazily, one url at a time, so that the urls of the whole
+catalog never have to be held in memory. The urls of a sitemap are streamed
+with lxml.etree.iterparse, the elements being dropped as soon as they are
+read.
+"""
+import gzip
+import io
+import sys
+
+from lxml import etree
+
+from dramascraper import markup
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def open_sitemap(source):
+    """
+    Opening a sitemap, compressed with gzip or not
+
+    Args:
+        source (str or bytes): path of the sitemap, or its content
+
+    Returns:
+        file: binary file of the uncompressed sitemap
+    """
+    if isinstance(source, bytes):
+        f = io.BytesIO(source)
+    else:
+        f = open(source, "rb")
+    if f.read(2) == GZIP_MAGIC:
+        f.seek(0)
+        return gzip.GzipFile(fileobj=f)
+    f.seek(0)
+
+    return f
+
+
+def iter_sitemap(source):
+    """
+    Reading the locations listed by a sitemap or by a sitemap index
+
+    Args:
+        source (str or bytes): path of the sitemap, or its content
+
+    Yields:
+        tuple: kind of the location ('url' for a page, 'sitemap' for another
+        sitemap listed by an index) and location
+    """
+    with open_sitemap(source) as f:
+        elements = etree.iterparse(f, tag=("{*}url", "{*}sitemap"),
+                                   resolve_entities=False, no_network=True)
+        for _, element in elements:
+            location = element.findtext("{*}loc")
+            kind = etree.QName(element).localname
+            # Dropping the elements already read, so that the tree stays
+            # empty whatever the size of the sitemap
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if location and location.strip():
+                yield kind, location.strip()
+
+
+def read_lines(path):
+    """
+    Reading the values (e.g. urls or usernames) of a file, one per line, the
+    blank lines being skipped
+
+    Args:
+        path (str): path of the file, '-' for the standard input
+
+    Yields:
+        str: value
+    """
+    if path == "-":
+        lines = sys.stdin
+    else:
+        lines = open(path, encoding="utf-8")
+    try:
+        for line in lines:
+            value = line.strip()
+            if value:
+                yield value
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+
+def id_range(ids):
+    """
+    Building the urls of a range of drama ids. MyDramaList redirects the url
+    of an id to the page of the drama.
+
+    Args:
+        ids (str): first and last ids, separated by a dash (e.g. '1-50000')
+
+    Yields:
+        str: url
+    """
+    first, last = (int(value) for value in ids.split("-", 1))
+    for drama_id in range(first, last + 1):
+        yield "https://mydramalist.com/" + str(drama_id)
+
+
+def get_drama_id(url):
+    """
+    Retrieving the id of a drama from the url of its page
+
+    Args:
+        url (str): url
+
+    Returns:
+        int: id of the drama. Equals to None if the url is not the one of the
+        page of a drama (e.g. a person, an article or a cast tab).
+    """
+    if not markup.PATTERNS["drama_page"].match(url):
+        return None
+
+    return int(markup.PATTERNS["drama_id"].search(url).group(1))
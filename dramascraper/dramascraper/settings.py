@@ -16,6 +16,10 @@ NEWSPIDER_MODULE = 'dramascraper.spiders'
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = 'dramascraper (+http://www.yourdomain.com)'
 
+# Pool of user agents sent in turn by the RotateUserAgentMiddleware (the
+# user agents bundled in dramascraper/useragents.py when it is not set)
+#USER_AGENTS = []
+
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = True
 
@@ -50,22 +54,134 @@ ROBOTSTXT_OBEY = True
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    'dramascraper.middlewares.DramascraperDownloaderMiddleware': 543,
-#}
+# The adaptive concurrency middleware sees the responses before the
+# RetryMiddleware (550), which retries the throttled requests
+DOWNLOADER_MIDDLEWARES = {
+    'dramascraper.middlewares.DramascraperDownloaderMiddleware': 560,
+    'dramascraper.middlewares.ReplayMiddleware': 50,
+    'dramascraper.middlewares.RotateUserAgentMiddleware': 500,
+    'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+EXTENSIONS = {
+    'dramascraper.extensions.FieldStats': 500,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 # ITEM_PIPELINES = {
 #    'dramascraper.pipelines.InsertItem': 300,
+#    'dramascraper.pipelines.NormalizedInsertItem': 310,
+#    'dramascraper.pipelines.JoinDramas': 200,
+#    'dramascraper.pipelines.ParquetExport': 400,
+#    'dramascraper.pipelines.RatingMatrix': 410,
 # }
 
+# Number of rows inserted per batch by the InsertItem pipeline, maximum time
+# (in seconds) a row stays buffered and number of connections to MySQL
+MYSQL_BATCH_SIZE = 500
+MYSQL_FLUSH_INTERVAL = 5
+MYSQL_POOL_SIZE = 3
+
+# Directory of the Parquet files written by the ParquetExport pipeline (which
+# is disabled when it is not set) and number of items per row group
+#PARQUET_EXPORT_DIR = 'parquet'
+PARQUET_ROW_GROUP_SIZE = 10000
+
+# Directory of the matrices of the scores written by the RatingMatrix pipeline
+# (which is disabled when it is not set) and number of scores buffered in
+# memory before they are written on disk
+#RATING_MATRIX_DIR = 'matrices'
+RATING_MATRIX_BUFFER_SIZE = 1000000
+
+# File of the records of the dramas stored by the JoinDramas pipeline when
+# running the dramalist spider, and joined to the rows of the lists of the
+# userdramalist spider (the pipeline is disabled when it is not set), and
+# number of records kept in memory
+#DRAMA_RECORDS_PATH = 'drama_records.sqlite3'
+DRAMA_RECORDS_CACHE_SIZE = 10000
+
+# Maximum number of lists of a given user requested at the same time by the
+# userdramalist spider
+USER_CONCURRENCY = 2
+
+# File of the index used by the incremental mode of the dramalist spider
+# (scrapy crawl dramalist -a incremental=true)
+INCREMENTAL_INDEX_PATH = 'drama_index.sqlite3'
+
+# File and time to live (in seconds) of the cache of the cast members used by
+# the dramalist spider (scrapy crawl dramalist -a cast_cache=true)
+CAST_CACHE_PATH = 'cast_cache.sqlite3'
+CAST_CACHE_TTL = 30 * 24 * 3600
+
+# Lease (in seconds) after which a url claimed from the shared frontier of
+# the dramalist spider (scrapy crawl dramalist -a frontier=<uri>) can be
+# claimed again, and number of urls claimed when a worker starts or is idle
+FRONTIER_LEASE = 600
+FRONTIER_BATCH_SIZE = 16
+# Number of times a url of the shared frontier is claimed (its scraping
+# failed or its worker died) before it is given up
+FRONTIER_MAX_ATTEMPTS = 3
+
+# Number of times the page of a field that could not be extracted is fetched
+# again by the tolerant mode of the dramalist spider
+# (scrapy crawl dramalist -a tolerant=true)
+FIELD_REFETCH_TIMES = 1
+
+# Number of dramas waiting for their cast tab kept in memory by the dramalist
+# spider, the others being written in a SQLite file : a temporary one, or
+# STAGING_PATH, which is kept when the crawl is interrupted (e.g. with a
+# JOBDIR)
+STAGING_MEMORY_ITEMS = 1000
+#STAGING_PATH = 'staging.sqlite3'
+
+# Maximum number of dramas being built (requested but not complete) at the
+# same time by the dramalist spider, the next ones being requested in the
+# order of the top shows as the previous ones complete (0 for no limit)
+MAX_BUILDING_DRAMAS = 100
+
+# File of the ids of the dramas scraped from the seeds by the dramalist
+# spider (scrapy crawl dramalist -a sitemap=<url or path>,
+# -a urls_file=<path> or -a ids=<first>-<last>). Set it to skip the dramas
+# completely scraped by a previous crawl.
+#SEED_SEEN_PATH = 'seen_ids.sqlite3'
+
+# Backend building the documents the spiders extract the fields from :
+# 'parsel' (the Selector of Scrapy) or 'lxml' (the raw body parsed directly,
+# without decoding it first). Check that both give the same items with
+# python -m benchmarks.parity before switching.
+PARSER_BACKEND = 'parsel'
+
+# Number of worker processes extracting the fields of the dramas' pages and
+# of their cast tabs for the dramalist spider, so that the parsing uses
+# several cores (0 to extract them in the main process)
+PARSE_WORKERS = 0
+
+# Adaptive concurrency of each class of pages (top shows, dramas, cast tabs,
+# users' lists) : initial and maximum concurrency, factor applied to the
+# concurrency when the site throttles a request, latency (in seconds) above
+# which the concurrency stops increasing and maximum download delay (in
+# seconds) once the concurrency is down to one. Do not enable AutoThrottle
+# at the same time.
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_START_CONCURRENCY = 2
+ADAPTIVE_MAX_CONCURRENCY = 16
+ADAPTIVE_DECREASE_FACTOR = 0.5
+ADAPTIVE_MAX_LATENCY = 5.0
+ADAPTIVE_MAX_DELAY = 60.0
+
+# Instrumentation of the get_* extractors of the spiders (time spent, None
+# values and exceptions of each field), exported in the stats and, every
+# FIELD_STATS_INTERVAL seconds, in a file in the Prometheus text format.
+# FIELD_STATS_SAMPLES urls of pages leading to None or to an exception are
+# kept for each extractor.
+FIELD_STATS_ENABLED = False
+#FIELD_STATS_PROMETHEUS_FILE = 'field_stats.prom'
+FIELD_STATS_INTERVAL = 60
+FIELD_STATS_SAMPLES = 5
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
@@ -86,3 +202,11 @@ ROBOTSTXT_OBEY = True
 #HTTPCACHE_DIR = 'httpcache'
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+
+# Storage recording the responses compressed and addressed by their content,
+# which can be served back by the replay server (python -m dramascraper.replay)
+#HTTPCACHE_STORAGE = 'dramascraper.replay.ReplayCacheStorage'
+
+# Url of the replay server the requests made to MyDramaList are sent to
+# instead (disabled when it is not set)
+#REPLAY_URL = 'http://127.0.0.1:8080'
@@ -0,0 +1,289 @@
+"""
+Sparse matrices written on disk in the .npy format of NumPy, so that they
+can be memory-mapped (numpy.load(path, mmap_mode="r")) and wrapped by
+scipy.sparse without being copied.
+
+The arrays are written with the array module of the standard library, so
+that NumPy is not required to build them. The header of a file, which holds
+its shape, is written once the array is complete.
+"""
+import ast
+import mmap
+import os
+import sys
+from array import array
+
+MAGIC = b"\x93NUMPY\x01\x00"
+# Size of the header of the files, whatever their shape (a multiple of 64)
+HEADER_SIZE = 128
+# Type of the values of NumPy for each type code of the array module
+DTYPES = {"i": "i4", "q": "i8", "f": "f4"}
+# Number of values read at once when the arrays are read back
+CHUNK_SIZE = 1 << 20
+
+
+def get_descr(typecode):
+    """
+    Retrieving the type of the values of NumPy of an array
+
+    Args:
+        typecode (str): type code of the array module
+
+    Returns:
+        str: type of the values (e.g. '<i4')
+    """
+    if array(typecode).itemsize != int(DTYPES[typecode][1:]):
+        raise ValueError("Unsupported size of the type code " + typecode)
+    order = "<" if sys.byteorder == "little" else ">"
+
+    return order + DTYPES[typecode]
+
+
+def write_header(f, typecode, length):
+    """
+    Writing the header of a .npy file at its beginning
+
+    Args:
+        f (file): binary file
+        typecode (str): type code of the values
+        length (int): number of values
+    """
+    header = "{{'descr': '{}', 'fortran_order': False, 'shape': ({},), }}" \
+        .format(get_descr(typecode), length)
+    header = header.ljust(HEADER_SIZE - len(MAGIC) - 2 - 1) + "\n"
+    f.seek(0)
+    f.write(MAGIC + len(header).to_bytes(2, "little") +
+            header.encode("latin-1"))
+
+
+def read_length(path):
+    """
+    Reading the number of values of a .npy file written by NpyFile
+
+    Args:
+        path (str): path of the file
+
+    Returns:
+        int: number of values
+    """
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)[len(MAGIC) + 2:].decode("latin-1")
+
+    return ast.literal_eval(header)["shape"][0]
+
+
+def iter_chunks(path, typecode):
+    """
+    Reading the values of a .npy file written by NpyFile by chunks
+
+    Args:
+        path (str): path of the file
+        typecode (str): type code of the values
+
+    Yields:
+        array.array: values
+    """
+    length = read_length(path)
+    with open(path, "rb") as f:
+        f.seek(HEADER_SIZE)
+        while length:
+            values = array(typecode)
+            values.fromfile(f, min(CHUNK_SIZE, length))
+            length -= len(values)
+            yield values
+
+
+class NpyFile:
+    """
+    One-dimensional array appended to a .npy file as it grows
+    """
+
+    def __init__(self, path, typecode):
+        self.path = path
+        self.typecode = typecode
+        self.length = 0
+        self.f = open(path, "wb")
+        self.f.write(b"\0" * HEADER_SIZE)
+
+    def write(self, values):
+        """
+        Appending values to the array
+
+        Args:
+            values (array.array): values of the same type code
+        """
+        values.tofile(self.f)
+        self.length += len(values)
+
+    def close(self):
+        """
+        Writing the header of the file and closing it
+        """
+        write_header(self.f, self.typecode, self.length)
+        self.f.close()
+
+
+def create_npy(path, typecode, length):
+    """
+    Creating a .npy file of a given length, filled with zeros
+
+    Args:
+        path (str): path of the file
+        typecode (str): type code of the values
+        length (int): number of values
+    """
+    with open(path, "wb") as f:
+        f.truncate(HEADER_SIZE + length * array(typecode).itemsize)
+        write_header(f, typecode, length)
+
+
+def resize_npy(path, typecode, length):
+    """
+    Truncating a .npy file to a smaller number of values
+
+    Args:
+        path (str): path of the file
+        typecode (str): type code of the values
+        length (int): number of values kept
+    """
+    with open(path, "r+b") as f:
+        f.truncate(HEADER_SIZE + length * array(typecode).itemsize)
+        write_header(f, typecode, length)
+
+
+def scatter_values(rows_path, cols_path, data_path, indptr, indices, data):
+    """
+    Scattering the values of a COO matrix at the position of their row in
+    the arrays of a CSR matrix, in the order of the COO matrix
+
+    Args:
+        rows_path (str): .npy file of the row of each value
+        cols_path (str): .npy file of the column of each value
+        data_path (str): .npy file of the values (float32)
+        indptr (array.array): position of the first value of each row
+        indices (memoryview): column of each value of the CSR matrix
+        data (memoryview): values of the CSR matrix
+    """
+    # Next position of each row
+    positions = indptr[:-1]
+    chunks = zip(iter_chunks(rows_path, "i"), iter_chunks(cols_path, "i"),
+                 iter_chunks(data_path, "f"))
+    for rows, cols, values in chunks:
+        for row, col, value in zip(rows, cols, values):
+            position = positions[row]
+            indices[position] = col
+            data[position] = value
+            positions[row] = position + 1
+
+
+def merge_rows(indptr, indices, data):
+    """
+    Sorting the columns of each row of a CSR matrix and merging the values
+    given several times to the same position (e.g. a drama listed twice by a
+    user), the last one being kept. The rows are compacted in place.
+
+    Args:
+        indptr (array.array): position of the first value of each row
+        indices (memoryview): column of each value
+        data (memoryview): values
+
+    Returns:
+        array.array: position of the first value of each compacted row
+    """
+    merged = array("q", [0])
+    position = 0
+    for start, end in zip(indptr, indptr[1:]):
+        # Read before being overwritten, as the row only moves backwards.
+        # The last value of a column overwrites the previous ones.
+        row = dict(zip(indices[start:end], data[start:end]))
+        for col in sorted(row):
+            indices[position] = col
+            data[position] = row[col]
+            position += 1
+        merged.append(position)
+
+    return merged
+
+
+def write_coo(indptr, indices_path, values_path, rows_path, cols_path,
+              data_path):
+    """
+    Writing the files of a COO matrix from a CSR matrix, the values being
+    ordered by row then by column
+
+    Args:
+        indptr (array.array): position of the first value of each row
+        indices_path (str): .npy file of the column of each value of the CSR
+        matrix
+        values_path (str): .npy file of the values of the CSR matrix
+        rows_path (str): .npy file of the row of each value
+        cols_path (str): .npy file of the column of each value
+        data_path (str): .npy file of the values (float32)
+    """
+    rows_file = NpyFile(rows_path, "i")
+    rows = array("i")
+    for row, (start, end) in enumerate(zip(indptr, indptr[1:])):
+        rows.extend(array("i", [row]) * (end - start))
+        if len(rows) >= CHUNK_SIZE:
+            rows_file.write(rows)
+            rows = array("i")
+    rows_file.write(rows)
+    rows_file.close()
+    for source, path, typecode in ((indices_path, cols_path, "i"),
+                                   (values_path, data_path, "f")):
+        f = NpyFile(path, typecode)
+        for values in iter_chunks(source, typecode):
+            f.write(values)
+        f.close()
+
+
+def build_csr(rows_path, cols_path, data_path, counts, directory):
+    """
+    Building a CSR matrix from a COO matrix. The values of each row are
+    scattered at their position in memory-mapped files, so that neither
+    matrix has to fit in memory. The columns of each row are then sorted and
+    the duplicate values of a position merged (scipy.sparse would sum them),
+    and the files of the COO matrix are written again without them.
+
+    Args:
+        rows_path (str): .npy file of the row of each value
+        cols_path (str): .npy file of the column of each value
+        data_path (str): .npy file of the values (float32)
+        counts (array.array): number of values of each row
+        directory (str): directory the indptr.npy, indices.npy and data.npy
+        files of the CSR matrix are written in
+
+    Returns:
+        int: number of values of the matrix, once merged
+    """
+    indptr = array("q", [0])
+    for count in counts:
+        indptr.append(indptr[-1] + count)
+    nb_values = indptr[-1]
+    indices_path = os.path.join(directory, "indices.npy")
+    values_path = os.path.join(directory, "data.npy")
+    create_npy(indices_path, "i", nb_values)
+    create_npy(values_path, "f", nb_values)
+    if nb_values:
+        with open(indices_path, "r+b") as fi, open(values_path, "r+b") as fd:
+            indices_map = mmap.mmap(fi.fileno(), 0)
+            data_map = mmap.mmap(fd.fileno(), 0)
+            indices = memoryview(indices_map)[HEADER_SIZE:].cast("i")
+            data = memoryview(data_map)[HEADER_SIZE:].cast("f")
+            scatter_values(rows_path, cols_path, data_path, indptr, indices,
+                           data)
+            indptr = merge_rows(indptr, indices, data)
+            indices.release()
+            data.release()
+            indices_map.close()
+            data_map.close()
+        nb_values = indptr[-1]
+        resize_npy(indices_path, "i", nb_values)
+        resize_npy(values_path, "f", nb_values)
+    indptr_file = NpyFile(os.path.join(directory, "indptr.npy"), "q")
+    indptr_file.write(indptr)
+    indptr_file.close()
+    write_coo(indptr, indices_path, values_path, rows_path, cols_path,
+              data_path)
+
+    return nb_values
@@ -1,27 +1,179 @@
+import heapq
 import logging
-import re
+import os
+import socket
+from collections import deque
 
 import scrapy
-from fake_useragent import UserAgent
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+
+from dramascraper import markup, parsing, seeds
+from dramascraper.checkpoint import Checkpoint
+from dramascraper.frontier import open_frontier
+from dramascraper.storage import (CastCache, DramaIndex, SeenIds,
+                                  StagingStore, fingerprint)
 
 
 class DramalistSpider(scrapy.Spider):
     name = 'dramalist'
     MAX_PAGES = 250
+    # Rank of the pages of the top shows, the dramas of a page coming right
+    # after it (the lowest rank first). It is used as priority by the shared
+    # frontier and, negated, as priority of the requests.
+    PAGE_PRIORITY = 100
+    # Priority added to the requests completing a drama (cast tab, pages
+    # fetched again), so that they go before any new page of the top shows
+    # or new drama
+    FOLLOW_UP_PRIORITY = (MAX_PAGES + 1) * PAGE_PRIORITY
+    # Items of the details lists (<li class="list-item p-a-0">) that are
+    # retrieved, keyed by the label of their <b> tag. Each label is
+    # associated to the name of the field and to the method parsing its text
+    DETAILS_PARSERS = {
+        "Duration": ("duration_in_minutes", "get_duration"),
+        "Episodes": ("nb_episodes", "get_nb_episodes"),
+        "Country": ("country_origin", "get_country_origin"),
+        "Ranked": ("ranking", "get_ranking"),
+        "Popularity": ("popularity_rank", "get_popularity"),
+        "Watchers": ("nb_watchers", "get_nb_watchers"),
+    }
+    # Fields of a drama's page (except the ones of the details lists) and of
+    # its cast tab, with the name of the method extracting them
+    MAIN_TAB_EXTRACTORS = {
+        "name": "get_drama_name",
+        "synopsis": "get_drama_synopsis",
+        "ratings": "get_user_rating",
+        "nb_ratings": "get_nb_rating",
+        "nb_reviews": "get_nb_reviews",
+        "streamed_on": "get_streaming_platform",
+        "genres": "get_genres",
+        "tags": "get_tags",
+    }
+    CAST_EXTRACTORS = {
+        "screenwriter": "get_screenwriter",
+        "director": "get_director",
+        "main_roles": "get_main_roles",
+        "support_roles": "get_support_roles",
+        "guest_roles": "get_guest_roles",
+    }
+    # Backend building the documents of the responses (see markup.document),
+    # set from the PARSER_BACKEND setting
+    parser_backend = "parsel"
+    # Pool of processes extracting the fields of the dramas' pages and of
+    # their cast tabs, set from the PARSE_WORKERS setting (None to extract
+    # them in the main process)
+    parse_pool = None
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        # Generating fake user agent that will be included in the headers
-        ua = UserAgent()
-        user_agent = ua.chrome
-        self.headers = {"user-agent": user_agent}
         # Setting an instance variable that enables/disables the insert Pipeline
+        # and another one enabling the insertion in the normalized tables
         if kwargs.get("sql", "").lower() == "true":
             logging.info("Insertion in MySQL enabled")
             self.sql = True
+            self.normalized = False
+        elif kwargs.get("sql", "").lower() == "normalized":
+            logging.info("Insertion in MySQL enabled (normalized tables)")
+            self.sql = True
+            self.normalized = True
         else:
             logging.info("Insertion in MySQL disabled")
             self.sql = False
+            self.normalized = False
+        # Setting an instance variable that enables/disables the incremental
+        # mode, which skips the dramas that did not change since the last crawl
+        if kwargs.get("incremental", "").lower() == "true":
+            logging.info("Incremental crawl enabled")
+            self.incremental = True
+        else:
+            self.incremental = False
+        # Setting an instance variable that enables/disables the cache of the
+        # cast members, which skips the requests to the fresh cast pages
+        if kwargs.get("cast_cache", "").lower() == "true":
+            logging.info("Cast cache enabled")
+            self.cast_cache = True
+        else:
+            self.cast_cache = False
+        # Setting an instance variable that enables/disables the tolerant
+        # mode, in which a field that cannot be extracted is set to None
+        # instead of dropping the whole drama
+        if kwargs.get("tolerant", "").lower() == "true":
+            logging.info("Tolerant extraction enabled")
+            self.tolerant = True
+        else:
+            self.tolerant = False
+        # Setting the uri of the frontier shared with other workers, if any,
+        # and the name of this worker
+        self.frontier = kwargs.get("frontier")
+        self.worker = kwargs.get(
+            "worker", "{}-{}".format(socket.gethostname(), os.getpid()))
+        if self.frontier:
+            logging.info("Shared frontier %s used by worker %s",
+                         self.frontier, self.worker)
+        # Setting the source the urls of the dramas are seeded from instead
+        # of the pages of the top shows, if any : a sitemap (url or path), a
+        # file of urls or a range of ids
+        self.seed = None
+        for argument in ("sitemap", "urls_file", "ids"):
+            if kwargs.get(argument):
+                self.seed = (argument, kwargs[argument])
+        if self.seed and self.frontier:
+            logging.warning("The seeds are ignored as a shared frontier is "
+                            "used")
+            self.seed = None
+        elif self.seed:
+            logging.info("Dramas seeded from %s %s", *self.seed)
+            if self.incremental:
+                logging.warning("The incremental mode is ignored as the "
+                                "dramas are seeded")
+                self.incremental = False
+        # The seeded urls and the ones of a shared frontier are already
+        # deduplicated, so that their requests are not filtered (a url given
+        # back to the frontier is requested again by the same worker)
+        self.deduplicated = self.seed is not None or bool(self.frontier)
+        # Setting the path of the checkpoint of the crawl, if any. A shared
+        # frontier already allows a crawl to be resumed.
+        self.checkpoint = kwargs.get("checkpoint")
+        if self.checkpoint and (self.frontier or self.seed):
+            logging.warning("The checkpoint is ignored as a shared frontier "
+                            "is used or the dramas are seeded")
+            self.checkpoint = None
+        elif self.checkpoint:
+            logging.info("Checkpoint of the crawl saved in %s",
+                         self.checkpoint)
+        # Dramas waiting to be requested (heap of (rank, url, fingerprint)
+        # tuples), urls of the dramas requested and not complete yet, and
+        # of all the dramas requested. At most 'max_building' dramas are
+        # being built at the same time (no limit if None).
+        self.held = []
+        self.building = set()
+        self.released = set()
+        self.max_building = None
+        # Iterators of the seeded urls and urls of the sitemaps left to
+        # request, one at a time
+        self.seed_sources = deque()
+        self.sitemaps = deque()
+        self.sitemap_pending = False
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(spider.spider_error,
+                                signal=signals.spider_error)
+        spider.parser_backend = crawler.settings.get("PARSER_BACKEND",
+                                                     "parsel")
+        if spider.parser_backend not in markup.BACKENDS:
+            raise ValueError("Unknown PARSER_BACKEND: " +
+                             spider.parser_backend)
+        nb_workers = crawler.settings.getint("PARSE_WORKERS", 0)
+        if nb_workers > 0:
+            logging.info("Fields extracted by %d worker processes",
+                         nb_workers)
+            spider.parse_pool = parsing.open_pool(nb_workers,
+                                                  spider.parser_backend)
+
+        return spider
 
     def start_requests(self):
         """
@@ -34,12 +186,573 @@ class DramalistSpider(scrapy.Spider):
             within start_requests
 
         Yields:
-            scrapy.Request: Request made to each page of the top shows.
+            scrapy.Request: Request made to each page of the top shows. When
+            a shared frontier is used, the pages are added to the frontier
+            and only the ones claimed by this worker are requested.
+        """
+        self.staging = StagingStore(
+            self.settings.getint("STAGING_MEMORY_ITEMS", 1000),
+            self.settings.get("STAGING_PATH"))
+        self.max_building = self.settings.getint("MAX_BUILDING_DRAMAS",
+                                                 100) or None
+        if self.incremental:
+            path = self.settings.get(
+                "INCREMENTAL_INDEX_PATH", "drama_index.sqlite3")
+            self.index = DramaIndex(path)
+            logging.info("%d dramas found in the index %s", len(self.index),
+                         path)
+        if self.cast_cache:
+            self.cast_store = CastCache(
+                self.settings.get("CAST_CACHE_PATH", "cast_cache.sqlite3"),
+                self.settings.getint("CAST_CACHE_TTL", 30 * 24 * 3600))
+        if self.frontier:
+            self.frontier_store = open_frontier(
+                self.frontier, self.settings.getint("FRONTIER_LEASE", 600),
+                self.settings.getint("FRONTIER_MAX_ATTEMPTS", 3))
+            self.frontier_store.add("top", [
+                (self.top_page_url(i), i * self.PAGE_PRIORITY, str(i))
+                for i in range(1, self.MAX_PAGES + 1)
+            ])
+            batch_size = self.settings.getint("FRONTIER_BATCH_SIZE", 16)
+            yield from self.claim_requests(batch_size)
+            return
+        if self.checkpoint:
+            self.checkpoint_store = Checkpoint(self.checkpoint)
+            yield from self.resume_requests()
+            return
+        if self.seed:
+            # Ids of the dramas seeded by this crawl, and of the ones
+            # completely scraped by the previous crawls if SEED_SEEN_PATH is
+            # set, which are only recorded once their item is complete
+            self.seen = SeenIds()
+            path = self.settings.get("SEED_SEEN_PATH")
+            self.scraped = SeenIds(path) if path else None
+            self.open_seeds()
+            yield from self.release_dramas()
+            return
+        for i in range(1, self.MAX_PAGES + 1):
+            yield self.top_page_request(i)
+
+    def resume_requests(self):
+        """
+        Requesting what is left to scrape according to the checkpoint of a
+        previous crawl : the cast tabs requested but not scraped, the dramas
+        found but not scraped and the pages of the top shows not scraped
+
+        Yields:
+            scrapy.Request: Request made to what is left to scrape
         """
+        checkpoint = self.checkpoint_store
+        if checkpoint.pages:
+            logging.info("Resuming the crawl : %d pages, %d dramas done",
+                         len(checkpoint.pages), len(checkpoint.done))
+        for url, entry_fingerprint, data in checkpoint.pending_casts():
+            self.building.add(url)
+            self.released.add(url)
+            yield self.cast_request(data, {"entry": (url, entry_fingerprint)})
+        for url, entry_fingerprint, page, position in \
+                checkpoint.pending_dramas():
+            self.hold_drama(url, entry_fingerprint,
+                            self.drama_rank(page, position))
+        yield from self.release_dramas()
         for i in range(1, self.MAX_PAGES + 1):
-            url = "https://mydramalist.com/shows/top?page=" + str(i)
-            yield scrapy.Request(url, headers=self.headers,
-                                 callback=self.scrap)
+            if i not in checkpoint.pages:
+                yield self.top_page_request(i)
+
+    def open_seeds(self):
+        """
+        Opening the source the urls of the dramas are seeded from. A remote
+        sitemap is requested once the dramas are released.
+        """
+        kind, value = self.seed
+        if kind == "ids":
+            self.seed_sources.append(seeds.id_range(value))
+        elif kind == "urls_file":
+            self.seed_sources.append(seeds.read_lines(value))
+        elif value.startswith(("http://", "https://")):
+            self.sitemaps.append(value)
+        else:
+            self.seed_sources.append(self.sitemap_seeds(value))
+
+    def sitemap_seeds(self, source):
+        """
+        Reading the urls listed by a sitemap. The sitemaps listed by a
+        sitemap index are queued to be requested.
+
+        Args:
+            source (str or bytes): path of the sitemap, or its content
+
+        Yields:
+            str: url
+        """
+        for kind, location in seeds.iter_sitemap(source):
+            if kind == "sitemap":
+                self.sitemaps.append(location)
+            else:
+                yield location
+
+    def next_seed(self):
+        """
+        Retrieving the next seeded url of a drama that has not been seen yet
+        (or scraped by a previous crawl). The other urls (people,
+        articles...) are skipped.
+
+        Returns:
+            str: url of the drama. Equals to None if no seeded url is left
+            for now.
+        """
+        while self.seed_sources:
+            for url in self.seed_sources[0]:
+                drama_id = seeds.get_drama_id(url)
+                if drama_id is None:
+                    self.crawler.stats.inc_value("seeds/skipped")
+                elif self.scraped is not None and drama_id in self.scraped:
+                    self.crawler.stats.inc_value("seeds/scraped_before")
+                elif self.seen.add(drama_id):
+                    self.crawler.stats.inc_value("seeds/dramas")
+                    return url
+                else:
+                    self.crawler.stats.inc_value("seeds/duplicates")
+            self.seed_sources.popleft()
+
+        return None
+
+    def sitemap_request(self, url):
+        """
+        Building the request to a sitemap
+
+        Args:
+            url (str): url of the sitemap
+
+        Returns:
+            scrapy.Request: Request made to the sitemap
+        """
+        self.sitemap_pending = True
+
+        return scrapy.Request(url, callback=self.parse_sitemap,
+                              errback=self.sitemap_failed,
+                              priority=self.FOLLOW_UP_PRIORITY)
+
+    def parse_sitemap(self, response):
+        """
+        Callback method used when requesting a sitemap, whose urls are then
+        seeded as the dramas are released
+
+        Args:
+            response (scrapy.http.response): Response from a request made to
+            a sitemap (compressed with gzip or not)
+
+        Yields:
+            scrapy.Request: Request made to the released dramas
+        """
+        self.sitemap_pending = False
+        self.crawler.stats.inc_value("seeds/sitemaps")
+        self.seed_sources.append(self.sitemap_seeds(response.body))
+
+        yield from self.release_dramas()
+
+    def sitemap_failed(self, failure):
+        """
+        Errback of the requests made to the sitemaps
+
+        Args:
+            failure (twisted.python.failure.Failure): failure of the request
+
+        Returns:
+            list: Requests made to the released dramas or to the next sitemap
+        """
+        self.sitemap_pending = False
+
+        return self.release_dramas()
+
+    def top_page_url(self, page):
+        return "https://mydramalist.com/shows/top?page=" + str(page)
+
+    def drama_rank(self, page, position):
+        """
+        Computing the rank of a drama, which orders the dramas as on the top
+        shows
+
+        Args:
+            page (int): number of the page of the top shows
+            position (int): position of the drama among the ones requested
+            from the page
+
+        Returns:
+            int: rank of the drama (the lowest first)
+        """
+        return page * self.PAGE_PRIORITY + position + 1
+
+    def top_page_request(self, page):
+        """
+        Building the request to a page of the top shows
+
+        Args:
+            page (int): number of the page
+
+        Returns:
+            scrapy.Request: Request made to the page
+        """
+        return scrapy.Request(self.top_page_url(page),
+                              callback=self.scrap,
+                              errback=self.top_page_failed,
+                              dont_filter=self.deduplicated,
+                              meta={"page": page},
+                              priority=-page * self.PAGE_PRIORITY)
+
+    def top_page_failed(self, failure):
+        """
+        Errback of the requests made to the pages of the top shows
+
+        Args:
+            failure (twisted.python.failure.Failure): failure of the request
+
+        Returns:
+            list: Request made to a new url claimed from the shared frontier
+        """
+        return self.give_back(failure.request.meta)
+
+    def main_tab_request(self, url, entry_fingerprint, rank=None):
+        """
+        Building the request to the page of a drama
+
+        Args:
+            url (str): url of the drama
+            entry_fingerprint (str): fingerprint of the drama's entry on the
+            top shows (None if the incremental mode is disabled)
+            rank (int): rank of the drama (None if unknown)
+
+        Returns:
+            scrapy.Request: Request made to the page
+        """
+        if self.parse_pool is not None:
+            callback = self.parse_main_tab_in_pool
+        else:
+            callback = self.parse_main_tab
+
+        return scrapy.Request(url, callback=callback,
+                              errback=self.drama_failed,
+                              dont_filter=self.deduplicated,
+                              priority=-(rank or 0),
+                              meta={"entry": (url, entry_fingerprint),
+                                    "rank": rank})
+
+    def hold_drama(self, url, entry_fingerprint, rank):
+        """
+        Adding a drama to the ones waiting to be requested
+
+        Args:
+            url (str): url of the drama
+            entry_fingerprint (str): fingerprint of the drama's entry on the
+            top shows (None if the incremental mode is disabled)
+            rank (int): rank of the drama
+        """
+        heapq.heappush(self.held, (rank, url, entry_fingerprint))
+
+    def release_dramas(self):
+        """
+        Requesting the best ranked dramas waiting to be requested, then the
+        seeded ones, as long as less than 'max_building' dramas are being
+        built. A drama already requested (e.g. found on two pages of the top
+        shows as its rank changed during the crawl) is skipped. The next
+        sitemap is requested once the seeded urls are exhausted.
+
+        Returns:
+            list: Requests made to the pages of the dramas or to a sitemap
+        """
+        requests = []
+        while self.max_building is None or \
+                len(self.building) < self.max_building:
+            if self.held:
+                rank, url, entry_fingerprint = heapq.heappop(self.held)
+                if url in self.released:
+                    continue
+                self.released.add(url)
+            else:
+                url = self.next_seed()
+                if url is None:
+                    break
+                rank = entry_fingerprint = None
+            self.building.add(url)
+            requests.append(self.main_tab_request(url, entry_fingerprint,
+                                                  rank))
+        if self.sitemaps and not self.sitemap_pending and \
+                not self.seed_sources:
+            requests.append(self.sitemap_request(self.sitemaps.popleft()))
+
+        return requests
+
+    def drama_finished(self, entry):
+        """
+        Method called once a drama is no longer being built (complete or
+        dropped), which releases the next drama waiting to be requested
+
+        Args:
+            entry (tuple): url and fingerprint of the drama's entry on the
+            top shows
+
+        Returns:
+            list: Requests made to the released dramas
+        """
+        if entry is None:
+            return []
+        self.building.discard(entry[0])
+
+        return self.release_dramas()
+
+    def drama_failed(self, failure):
+        """
+        Errback of the requests made to the pages of the dramas
+
+        Args:
+            failure (twisted.python.failure.Failure): failure of the request
+
+        Returns:
+            list: Requests made to the released dramas or to a new url
+            claimed from the shared frontier
+        """
+        meta = failure.request.meta
+
+        return self.drama_finished(meta.get("entry")) + self.give_back(meta)
+
+    def staged_request(self, url, callback, data, meta, **kwargs):
+        """
+        Building a request to a page completing a drama. The information
+        already retrieved is put in the staging store, only its key (the url
+        of the drama) travelling in the request.
+
+        Args:
+            url (str): url of the page
+            callback (callable): callback of the request
+            data (dict): Information about the drama already retrieved
+            meta (dict): meta of the request made to the last page scraped
+            **kwargs: meta of the request, in addition to the key, the entry
+            and the url claimed from the shared frontier
+
+        Returns:
+            scrapy.Request: Request made to the page
+        """
+        key = data["mydramalist_url"]
+        self.staging.put(key, data)
+        rank = meta.get("rank")
+
+        return scrapy.Request(url, callback=callback,
+                              errback=self.staged_request_failed,
+                              dont_filter=kwargs.pop("dont_filter",
+                                                     self.deduplicated),
+                              priority=self.FOLLOW_UP_PRIORITY - (rank or 0),
+                              meta=dict(kwargs,
+                                        staging_key=key,
+                                        entry=meta.get("entry"),
+                                        rank=rank,
+                                        frontier_url=meta.get("frontier_url")))
+
+    def get_staged_data(self, response):
+        """
+        Retrieving the information about a drama put in the staging store
+        when the page was requested
+
+        Args:
+            response (scrapy.http.response): Response from a request built by
+            staged_request
+
+        Returns:
+            dict: Information about the drama. Equals to None if it is not in
+            the store (e.g. when a crawl is resumed from a JOBDIR with a
+            temporary store), the drama's page being requested again.
+        """
+        data = self.staging.pop(response.meta["staging_key"])
+        if data is None:
+            logging.warning("Information about %s not found in the staging "
+                            "store", response.meta["staging_key"])
+            self.crawler.stats.inc_value("staging/missing")
+        return data
+
+    def staged_request_failed(self, failure):
+        """
+        Errback of the requests built by staged_request, which removes the
+        information about the drama from the staging store
+
+        Args:
+            failure (twisted.python.failure.Failure): failure of the request
+
+        Returns:
+            list: Requests made to the released dramas or to a new url
+            claimed from the shared frontier
+        """
+        meta = failure.request.meta
+        self.staging.pop(meta["staging_key"])
+        self.crawler.stats.inc_value("staging/dropped")
+
+        return self.drama_finished(meta.get("entry")) + self.give_back(meta)
+
+    def request_again(self, meta):
+        """
+        Requesting again the page of a drama whose information was lost
+
+        Args:
+            meta (dict): meta of the request made to the last page scraped
+
+        Returns:
+            scrapy.Request: Request made to the page of the drama
+        """
+        request = self.main_tab_request(*meta["entry"], meta.get("rank")) \
+            .replace(dont_filter=True)
+        request.meta["frontier_url"] = meta.get("frontier_url")
+
+        return request
+
+    def cast_request(self, data, meta):
+        """
+        Building the request to the cast tab of a drama
+
+        Args:
+            data (dict): Information about the drama retrieved from its page
+            meta (dict): meta of the request made to the drama's page
+
+        Returns:
+            scrapy.Request: Request made to the cast tab
+        """
+        casting_url = data["mydramalist_url"] + "/cast"
+        if self.parse_pool is not None:
+            callback = self.parse_cast_in_pool
+        else:
+            callback = self.get_cast_members
+
+        return self.staged_request(casting_url, callback, data, meta)
+
+    def claim_requests(self, nb_urls):
+        """
+        Claiming urls from the shared frontier
+
+        Args:
+            nb_urls (int): maximum number of urls to claim
+
+        Returns:
+            list: Requests made to the claimed urls
+        """
+        requests = []
+        for url, kind, payload in self.frontier_store.claim(self.worker,
+                                                            nb_urls):
+            if kind == "top":
+                request = self.top_page_request(int(payload))
+            else:
+                request = self.main_tab_request(url, payload)
+            request.meta["frontier_url"] = url
+            requests.append(request)
+
+        return requests
+
+    def acknowledge(self, meta):
+        """
+        Acknowledging to the shared frontier that a claimed url has been
+        scraped, and claiming a new one in replacement
+
+        Args:
+            meta (dict): meta of the request made to the claimed url (or of
+            the requests following it)
+
+        Returns:
+            list: Request made to the new claimed url
+        """
+        url = meta.get("frontier_url")
+        if not self.frontier or url is None:
+            return []
+        self.frontier_store.ack(url)
+
+        return self.claim_requests(1)
+
+    def give_back(self, meta):
+        """
+        Giving back to the shared frontier a claimed url whose scraping
+        failed, so that it is claimed again until it has been claimed
+        FRONTIER_MAX_ATTEMPTS times, and claiming a new one in replacement
+
+        Args:
+            meta (dict): meta of the request made to the claimed url (or of
+            the requests following it)
+
+        Returns:
+            list: Request made to the new claimed url
+        """
+        url = meta.get("frontier_url")
+        if not self.frontier or url is None:
+            return []
+        if self.frontier_store.fail(url):
+            logging.warning("%s given up after %d attempts", url,
+                            self.frontier_store.max_attempts)
+            self.crawler.stats.inc_value("frontier/given_up")
+        else:
+            self.crawler.stats.inc_value("frontier/given_back")
+
+        return self.claim_requests(1)
+
+    def schedule(self, request):
+        """
+        Sending a request to the engine outside of a callback
+
+        Args:
+            request (scrapy.Request): request to send
+        """
+        try:
+            self.crawler.engine.crawl(request)
+        except TypeError:
+            # Versions of Scrapy older than 2.6 require the spider
+            self.crawler.engine.crawl(request, self)
+
+    def spider_idle(self):
+        """
+        Method called when no request is left. Dramas still waiting to be
+        requested (or seeded) are released, as the dramas considered as being
+        built were lost (e.g. filtered out by a middleware). When a shared
+        frontier is used, new urls are claimed and the spider is kept open
+        while other workers are still scraping (their urls may have to be
+        claimed again if they die).
+        """
+        if self.held or self.seed_sources or self.sitemaps:
+            self.building.clear()
+            self.sitemap_pending = False
+            requests = self.release_dramas()
+            for request in requests:
+                self.schedule(request)
+            if requests:
+                self.crawler.stats.inc_value("priority/idle_releases")
+                raise DontCloseSpider
+        if not self.frontier:
+            return
+        batch_size = self.settings.getint("FRONTIER_BATCH_SIZE", 16)
+        requests = self.claim_requests(batch_size)
+        for request in requests:
+            self.schedule(request)
+        if requests or self.frontier_store.has_pending():
+            raise DontCloseSpider
+
+    def spider_error(self, failure, response, spider):
+        """
+        Method called when a callback raised an exception. The drama it was
+        building, if any, is dropped and the url claimed from the shared
+        frontier is given back.
+
+        Args:
+            failure (twisted.python.failure.Failure): exception raised
+            response (scrapy.http.response): Response given to the callback
+            spider (scrapy.Spider): spider
+        """
+        for request in self.drama_finished(response.meta.get("entry")) + \
+                self.give_back(response.meta):
+            self.schedule(request)
+
+    def document(self, response):
+        """
+        Building the document of a response with the backend of the spider
+
+        Args:
+            response (scrapy.http.response): Response from a scrapy.Request
+
+        Returns:
+            lxml element: root of the document the fields are extracted from
+        """
+        return markup.document(response, self.parser_backend)
 
     def get_drama_name(self, response):
         """
@@ -52,7 +765,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             str: name of the drama
         """
-        name = response.css("title::text").get()
+        name = markup.get("name", response)
         name = name.replace(" - MyDramaList", "")
 
         return name
@@ -69,7 +782,7 @@ class DramalistSpider(scrapy.Spider):
             str: cleaned content
         """
         content = content.replace("\n", " ")
-        content = re.sub(r"\s+", " ", content)
+        content = markup.PATTERNS["whitespaces"].sub(" ", content)
 
         return content
 
@@ -84,8 +797,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             str: Synopsis
         """
-        xpath = "//div[@class='show-synopsis']//span/text()"
-        synopsis = response.xpath(xpath).getall()
+        synopsis = markup.getall("synopsis", response)
         synopsis = " ".join(synopsis)
         synopsis = self.processing_synopsis(synopsis)
 
@@ -102,7 +814,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             float: Drama's rating. Equals to None if not existing.
         """
-        rating = response.css(".deep-orange::text").get()
+        rating = markup.get("rating", response)
         try:
             return float(rating)
         except ValueError:
@@ -119,15 +831,13 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             int: number of users
         """
-        xpath = "//div[@class='hfs']/text()"
-        text = response.xpath(xpath).getall()
+        text = markup.getall("nb_ratings", response)
         text = [x for x in text if "user" in x]
         if text:
             text = text[0]
         else:
             return 0
-        regex_pattern = r"(\d+(?:\,\d+)*) user"
-        nb_rating = re.search(regex_pattern, text).group(1)
+        nb_rating = markup.PATTERNS["nb_ratings"].search(text).group(1)
         nb_rating = nb_rating.replace(",", "")
         nb_rating = int(nb_rating)
 
@@ -144,9 +854,8 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             int: number of reviews written
         """
-        xpath = "//div[@class='hfs'][contains(., 'Reviews:')]/a/text()"
-        text = response.xpath(xpath).get()
-        nb_reviews = re.search(r'(\d*) user', text).group(1)
+        text = markup.get("nb_reviews", response)
+        nb_reviews = markup.PATTERNS["nb_reviews"].search(text).group(1)
         nb_reviews = int(nb_reviews)
 
         return nb_reviews
@@ -163,136 +872,185 @@ class DramalistSpider(scrapy.Spider):
             int: Number of minutes
         """
         try:
-            nb_hours = re.search(r"(\d*) hr\.", duration).group(1)
+            nb_hours = markup.PATTERNS["hours"].search(duration).group(1)
             nb_hours = int(nb_hours)
         except AttributeError:
             nb_hours = 0
         hours_to_minute = nb_hours * 60
 
-        initial_nb_minutes = re.search(r"(\d*) min\.", duration).group(1)
+        initial_nb_minutes = markup.PATTERNS["minutes"].search(duration)
+        initial_nb_minutes = initial_nb_minutes.group(1)
         initial_nb_minutes = int(initial_nb_minutes)
 
         return hours_to_minute + initial_nb_minutes
 
-    def get_duration(self, response):
+    def get_duration(self, text):
         """
         Retieving the duration of each episode of a given drama
 
         Args:
-            response (scrapy.http.response): Response from a scrapy.Request 
-            made to a drama's page
+            text (str): Text of the 'Duration' item of the details list
 
         Returns:
             int: Duration of an episode in minutes
         """
-        xpath = (
-            "//li[@class='list-item p-a-0']"
-            "[child::b[@class='inline duration']]/text()"
-        )
-        duration = response.xpath(xpath).get()
-        if duration is not None:
-            duration = self.duration_to_minutes(duration)
-
-        return duration
+        return self.duration_to_minutes(text)
 
-    def get_nb_episodes(self, response):
+    def get_nb_episodes(self, text):
         """
         Retrieving a drama's number of episodes
 
         Args:
-            response (scrapy.http.response): Response from a scrapy.Request 
-            made to a drama's page
+            text (str): Text of the 'Episodes' item of the details list
 
         Returns:
             int: number of episodes
         """
-        xpath = (
-            "//li[@class='list-item p-a-0']"
-            "[child::b[contains(., 'Episodes')]]/text()"
-        )
-        nb_episodes = response.xpath(xpath).get()
-
-        return int(nb_episodes)
+        return int(text)
 
-    def get_country_origin(self, response):
+    def get_country_origin(self, text):
         """
         Retrieving the country of origin of a given drama
 
         Args:
-            response (scrapy.http.response): Response from a scrapy.Request 
-            made to a drama's page
+            text (str): Text of the 'Country' item of the details list
 
         Returns:
             str: Country of origin
         """
-        xpath = (
-            "//li[@class='list-item p-a-0']"
-            "[child::b[contains(., 'Country')]]/text()"
-        )
-
-        return response.xpath(xpath).get().strip()
+        return text.strip()
 
-    def get_ranking(self, response):
+    def get_ranking(self, text):
         """
         Retrieve the rank of the drama based on user's rating
 
         Args:
-            response (scrapy.http.response): Response from a scrapy.Request 
-            made to a drama's page
+            text (str): Text of the 'Ranked' item of the details list
 
         Returns:
             int: Rank of the drama on MyDramaList
         """
-
-        xpath = (
-            "//li[@class='list-item p-a-0']"
-            "[child::b[contains(., 'Ranked')]]/text()"
-        )
-        ranking = response.xpath(xpath).get().strip()
+        ranking = text.strip()
         ranking = ranking.replace("#", "")
 
         return int(ranking)
 
-    def get_popularity(self, response):
+    def get_popularity(self, text):
         """
         Retrieving the popularity (express as a rank) of a given drama
 
         Args:
-            response (scrapy.http.response): Response from a scrapy.Request 
-            made to a drama's page
+            text (str): Text of the 'Popularity' item of the details list
 
         Returns:
             int: Popularity rank
         """
-        xpath = (
-            "//li[@class='list-item p-a-0']"
-            "[child::b[contains(., 'Popularity')]]/text()"
-        )
-        popularity = response.xpath(xpath).get().strip()
+        popularity = text.strip()
         popularity = popularity.replace("#", "")
 
         return int(popularity)
 
-    def get_nb_watchers(self, response):
+    def get_nb_watchers(self, text):
         """
         Retrieve the number of users that are or have watched a given drama
 
         Args:
-            response (scrapy.http.response): Response from a scrapy.Request 
-            made to a drama's page
+            text (str): Text of the 'Watchers' item of the details list
 
         Returns:
             int: number of watchers
         """
-        xpath = (
-            "//li[@class='list-item p-a-0']"
-            "[child::b[contains(., 'Watchers')]]/text()"
-        )
-        nb_watchers = response.xpath(xpath).get().strip()
+        nb_watchers = text.strip()
         nb_watchers = nb_watchers.replace(",", "")
 
         return int(nb_watchers)
 
+    def extract_field(self, field, extractor, node, errors=None):
+        """
+        Extracting a field. When a dict of errors is given (tolerant mode),
+        an exception raised by the extractor is recorded in it and the field
+        is set to None.
+
+        Args:
+            field (str): name of the field
+            extractor (callable): method extracting the field
+            node: response or text the field is extracted from
+            errors (dict): error of each field that could not be extracted
+
+        Returns:
+            Value of the field
+        """
+        if errors is None:
+            return extractor(node)
+        try:
+            return extractor(node)
+        except Exception as e:
+            errors[field] = "{}: {}".format(type(e).__name__, e)
+            return None
+
+    def count_errors(self, fields):
+        """
+        Counting the fields that could not be extracted in the stats. They
+        are counted once extracted rather than by extract_field, which can
+        run in a worker process.
+
+        Args:
+            fields (iterable): names of the fields
+        """
+        for field in fields:
+            self.crawler.stats.inc_value("tolerant/errors/" + field)
+
+    def extract_fields(self, extractors, response, errors=None):
+        """
+        Extracting several fields from a page
+
+        Args:
+            extractors (dict): name of the method extracting each field
+            response (scrapy.http.response): Response from a scrapy.Request
+            errors (dict): error of each field that could not be extracted
+
+        Returns:
+            dict: Value of each field
+        """
+        return {
+            field: self.extract_field(field, getattr(self, method), response,
+                                      errors)
+            for field, method in extractors.items()
+        }
+
+    def get_details(self, response, errors=None):
+        """
+        Walking once through the items of the details lists of a drama's page
+        and sending the text of each item to the parser associated to its
+        <b> label in DETAILS_PARSERS
+
+        Args:
+            response (scrapy.http.response): Response from a scrapy.Request 
+            made to a drama's page
+            errors (dict): error of each field that could not be extracted
+
+        Returns:
+            dict: Parsed values keyed by field name. A value equals to None
+            when its label is missing from the page. When a label is repeated,
+            its first item is kept.
+        """
+        details = {field: None for field, _ in self.DETAILS_PARSERS.values()}
+        parsed = set()
+        for list_item in markup.getall("details", response):
+            label = markup.get("details_label", list_item, default="")
+            parser = self.DETAILS_PARSERS.get(label.strip().rstrip(":"))
+            if parser is None:
+                continue
+            field, method = parser
+            if field in parsed:
+                continue
+            parsed.add(field)
+            text = markup.get("details_text", list_item)
+            details[field] = self.extract_field(
+                field, getattr(self, method), text, errors)
+
+        return details
+
     def get_streaming_platform(self, response):
         """
         Retrieving the list of platofmrs that are broadcasting a given drama
@@ -304,14 +1062,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             list: list of platforms
         """
-        container_xpath = (
-            "//div[@class='box']"
-            "[descendant::h3[contains(., 'Where to Watch')]]"
-        )
-        platforms_xpath = ".//a[@class='text-primary']/b/text()"
-        container = response.xpath(container_xpath)
-        
-        return container.xpath(platforms_xpath).getall()
+        return markup.getall("streamed_on", response)
 
     def get_genres(self, response):
         """
@@ -324,11 +1075,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             list: list of genres
         """
-        xpath = (
-            "//li[@class='list-item p-a-0 show-genres'][child::b"
-            "[contains(., 'Genres')]]/a/text()"
-        )
-        return response.xpath(xpath).getall()
+        return markup.getall("genres", response)
 
     def get_tags(self, response):
         """
@@ -341,12 +1088,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             list: list of tags
         """
-        xpath = (
-            "//li[@class='list-item p-a-0 show-tags'][child::b"
-            "[contains(., 'Tags')]]/span/a/text()"
-        )
-
-        return response.xpath(xpath).getall()
+        return markup.getall("tags", response)
 
     def get_main_roles(self, response):
         """
@@ -359,12 +1101,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             list: list of actors
         """
-        xpath = (
-            "//ul[preceding-sibling::h3[1][contains(., 'Main Role')]]/li//a" 
-            "[@class='text-primary' and contains(@href, 'people')]/b/text()"
-        )
-
-        return response.xpath(xpath).getall()
+        return markup.getall("main_roles", response)
 
     def get_support_roles(self, response):
         """
@@ -377,12 +1114,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             list: list of actors
         """
-        xpath = (
-            "//ul[preceding-sibling::h3[1][contains(., 'Support Role')]]/li//a"
-            "[@class='text-primary' and contains(@href, 'people')]/b/text()"
-        )
-
-        return response.xpath(xpath).getall()
+        return markup.getall("support_roles", response)
 
     def get_guest_roles(self, response):
         """
@@ -395,12 +1127,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             list: list of actors
         """
-        xpath = (
-            "//ul[preceding-sibling::h3[1][contains(., 'Guest Role')]]/li//a"
-            "[@class='text-primary' and contains(@href, 'people')]/b/text()"
-        )
-
-        return response.xpath(xpath).getall()
+        return markup.getall("guest_roles", response)
 
     def get_screenwriter(self, response):
         """
@@ -413,13 +1140,7 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             str: name of the screenwriter
         """
-        xpath = (
-            "//ul[preceding-sibling::h3[1][contains(., 'Screenwriter')]]/li//a"
-            "[@class='text-primary text-ellipsis' and "
-            "contains(@href, 'people')]/b/text()"
-        )
-
-        return response.xpath(xpath).getall()
+        return markup.getall("screenwriter", response)
 
     def get_director(self, response):
         """
@@ -432,13 +1153,24 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             str: name of the director
         """
-        xpath = (
-            "//ul[preceding-sibling::h3[1][contains(., 'Director')]]/li//a"
-            "[@class='text-primary text-ellipsis' and "
-            "contains(@href, 'people')]/b/text()"
-        )
+        return markup.getall("director", response)
+
+    def get_mydramalist_id(self, url):
+        """
+        Retrieving the numeric id of the drama, which is stable when its title
+        (and the rest of its url) changes
 
-        return response.xpath(xpath).getall()
+        Args:
+            url (str): url of the drama's page
+
+        Returns:
+            int: id of the drama. Equals to None if the url has no id.
+        """
+        match = markup.PATTERNS["drama_id"].search(url)
+        if match is None:
+            return None
+
+        return int(match.group(1))
 
     def get_urls(self, response):
         """
@@ -452,10 +1184,35 @@ class DramalistSpider(scrapy.Spider):
         Returns:
             list: list of urls
         """
-        urls = response.css(".text-primary.title > a::attr(href)").getall()
+        urls = markup.getall("drama_urls", response)
 
         return ["https://mydramalist.com" + x for x in urls]
 
+    def get_entries(self, response):
+        """
+        Retrieving the url and the fingerprint of the entry of each drama
+        displayed on a given page from the top shows. The fingerprint changes
+        as soon as the ranking, the rating or any other text of the entry
+        changes.
+
+        Args:
+            response (scrapy.Request): Response from a scrapy.Request 
+            made to one of the top show's page
+
+        Returns:
+            list: list of (url, fingerprint) tuples
+        """
+        entries = []
+        for entry in markup.getall("listing_entries", response):
+            url = markup.get("drama_urls", entry)
+            if url is None:
+                continue
+            texts = markup.getall("listing_texts", entry)
+            url = "https://mydramalist.com" + url
+            entries.append((url, fingerprint(texts)))
+
+        return entries
+
     def scrap(self, response):
         """
         Callback method used when requesting one of the top show's page
@@ -465,22 +1222,99 @@ class DramalistSpider(scrapy.Spider):
             made to one of the top show's page
 
         Yields:
-            scrapy.Request: Request to the url associated to a given drama
+            scrapy.Request: Request to the url associated to a given drama. In
+            incremental mode, the dramas whose entry did not change since the
+            last crawl are skipped. When a shared frontier is used, the urls
+            are added to the frontier instead and a new url is claimed.
+        """
+        document = self.document(response)
+        if self.incremental:
+            entries = self.get_entries(document)
+        else:
+            entries = [(url, None) for url in self.get_urls(document)]
+
+        page = response.meta["page"]
+        requested = []
+        for position, (url, entry_fingerprint) in enumerate(entries):
+            if self.incremental and \
+                    self.index.is_unchanged(url, entry_fingerprint):
+                self.crawler.stats.inc_value("incremental/unchanged")
+                continue
+            requested.append((url, entry_fingerprint))
+
+        if self.frontier:
+            self.frontier_store.add("drama", [
+                (url, self.drama_rank(page, position), entry_fingerprint)
+                for position, (url, entry_fingerprint) in enumerate(requested)
+            ])
+            yield from self.acknowledge(response.meta)
+            return
+        if self.checkpoint:
+            self.checkpoint_store.page_scraped(page, requested)
+        for position, (url, entry_fingerprint) in enumerate(requested):
+            self.hold_drama(url, entry_fingerprint,
+                            self.drama_rank(page, position))
+        yield from self.release_dramas()
+
+    def extract_main_tab(self, response, errors=None):
         """
-        urls = self.get_urls(response)
+        Retrieving all the information of a given drama from its page (except
+        information regarding the casting)
+
+        Args:
+            response (scrapy.http.response): Response from a scrapy.Request
+            made to the page of a given drama
+            errors (dict): error of each field that could not be extracted
 
-        for url in urls:
-            yield scrapy.Request(
-                url, 
-                headers=self.headers,
-                callback=self.parse_main_tab)
+        Returns:
+            dict: Information about the drama
+        """
+        document = self.document(response)
+        details = self.get_details(document, errors)
+        fields = self.extract_fields(self.MAIN_TAB_EXTRACTORS, document,
+                                     errors)
+
+        return {
+            "name": fields["name"],
+            "synopsis": fields["synopsis"],
+            "duration_in_minutes": details["duration_in_minutes"],
+            "nb_episodes": details["nb_episodes"],
+            "country_origin": details["country_origin"],
+            "ratings": fields["ratings"],
+            "ranking": details["ranking"],
+            "popularity_rank": details["popularity_rank"],
+            "nb_watchers": details["nb_watchers"],
+            "nb_ratings": fields["nb_ratings"],
+            "nb_reviews": fields["nb_reviews"],
+            "streamed_on": fields["streamed_on"],
+            "genres": fields["genres"],
+            "tags": fields["tags"],
+            "mydramalist_url": response.url,
+            "mydramalist_id": self.get_mydramalist_id(response.url)
+        }
+
+    def extract_cast(self, response, errors=None):
+        """
+        Retrieving the cast members of a given drama from its cast tab
+
+        Args:
+            response (scrapy.http.response): Response from a scrapy.Request
+            made to the cast tab of a given drama
+            errors (dict): error of each field that could not be extracted
+
+        Returns:
+            dict: Cast members keyed by type of role
+        """
+        return self.extract_fields(self.CAST_EXTRACTORS,
+                                   self.document(response), errors)
 
     def parse_main_tab(self, response):
         """
         Callback method used within 'scrap' that retrieves all the information
         of a given drama (except information regarding the casting). This method
         then yields a scrapy.Request to the cast tab using and using the
-        get_cast_members callback method.
+        get_cast_members callback method. When the cast cache is enabled and
+        holds fresh cast members for this drama, the item is directly yielded.
 
         Args:
             response (scrapy.Request): Response from a scrapy.Request 
@@ -488,27 +1322,60 @@ class DramalistSpider(scrapy.Spider):
 
         Yields:
             scrapy.Request: Scrapy Request to the cast tab.
+            dict: Information about the drama if its cast members are cached
         """
-        data = {
-            "name": self.get_drama_name(response),
-            "synopsis": self.get_drama_synopsis(response),
-            "duration_in_minutes": self.get_duration(response),
-            "nb_episodes": self.get_nb_episodes(response),
-            "country_origin": self.get_country_origin(response),
-            "ratings": self.get_user_rating(response),
-            "ranking": self.get_ranking(response),
-            "popularity_rank": self.get_popularity(response),
-            "nb_watchers": self.get_nb_watchers(response),
-            "nb_ratings": self.get_nb_rating(response),
-            "nb_reviews": self.get_nb_reviews(response),
-            "streamed_on": self.get_streaming_platform(response),
-            "genres": self.get_genres(response),
-            "tags": self.get_tags(response),
-            "mydramalist_url": response.url
-        }
-        casting_url = response.url + "/cast"
-        yield scrapy.Request(casting_url, headers=self.headers,
-                             callback=self.get_cast_members, meta={"data": data})
+        errors = {} if self.tolerant else None
+        data = self.extract_main_tab(response, errors)
+        yield from self.main_tab_extracted(response, data, errors)
+
+    async def parse_main_tab_in_pool(self, response):
+        """
+        Callback used instead of parse_main_tab when the fields are extracted
+        by the pool of worker processes (PARSE_WORKERS setting)
+
+        Args:
+            response (scrapy.http.response): Response from a scrapy.Request
+            made to the page of a given drama
+
+        Returns:
+            list: results of parse_main_tab
+        """
+        data, errors = await parsing.run(self.parse_pool, "main_tab",
+                                         response, self.tolerant)
+
+        return list(self.main_tab_extracted(response, data, errors))
+
+    def main_tab_extracted(self, response, data, errors):
+        """
+        Requesting the cast tab of a drama once the information of its page
+        is extracted
+
+        Args:
+            response (scrapy.http.response): Response from a scrapy.Request
+            made to the page of a given drama
+            data (dict): Information about the drama
+            errors (dict): error of each field that could not be extracted
+            (None if the tolerant mode is disabled)
+
+        Yields:
+            scrapy.Request: Scrapy Request to the cast tab.
+            dict: Information about the drama if its cast members are cached
+        """
+        if errors is not None:
+            self.count_errors(errors)
+            data["field_errors"] = errors
+        if self.cast_cache:
+            cast_members = self.cast_store.get(response.url)
+            if cast_members is not None:
+                self.crawler.stats.inc_value("cast_cache/hit")
+                data.update(cast_members)
+                yield from self.finish_item(data, response.meta)
+                return
+            self.crawler.stats.inc_value("cast_cache/miss")
+        if self.checkpoint:
+            url, entry_fingerprint = response.meta["entry"]
+            self.checkpoint_store.cast_requested(url, entry_fingerprint, data)
+        yield self.cast_request(data, response.meta)
 
     def get_cast_members(self, response):
         """
@@ -522,11 +1389,216 @@ class DramalistSpider(scrapy.Spider):
             dict: Cast members stored as value. The keys are corresponding to
             the type of role (main, support, guest)
         """
-        main_tab_data = response.meta["data"]
-        main_tab_data["screenwriter"] = self.get_screenwriter(response)
-        main_tab_data["director"] = self.get_director(response)
-        main_tab_data["main_roles"] = self.get_main_roles(response)
-        main_tab_data["support_roles"] = self.get_support_roles(response)
-        main_tab_data["guest_roles"] = self.get_guest_roles(response)
+        main_tab_data = self.get_staged_data(response)
+        if main_tab_data is None:
+            yield self.request_again(response.meta)
+            return
+        errors = {} if "field_errors" in main_tab_data else None
+        cast_members = self.extract_cast(response, errors)
+        yield from self.cast_extracted(main_tab_data, response, cast_members,
+                                       errors)
+
+    async def parse_cast_in_pool(self, response):
+        """
+        Callback used instead of get_cast_members when the fields are
+        extracted by the pool of worker processes (PARSE_WORKERS setting)
+
+        Args:
+            response (scrapy.http.response): Response from a scrapy.Request
+            made to the cast tab of a given drama
+
+        Returns:
+            list: results of get_cast_members
+        """
+        main_tab_data = self.get_staged_data(response)
+        if main_tab_data is None:
+            return [self.request_again(response.meta)]
+        cast_members, errors = await parsing.run(
+            self.parse_pool, "cast", response,
+            "field_errors" in main_tab_data)
+
+        return list(self.cast_extracted(main_tab_data, response,
+                                        cast_members, errors))
+
+    def cast_extracted(self, main_tab_data, response, cast_members, errors):
+        """
+        Completing a drama once its cast members are extracted
+
+        Args:
+            main_tab_data (dict): Information about the drama retrieved from
+            its page
+            response (scrapy.http.response): Response from a scrapy.Request
+            made to the cast tab of a given drama
+            cast_members (dict): Cast members keyed by type of role
+            errors (dict): error of each cast field that could not be
+            extracted (None if the tolerant mode is disabled)
+
+        Yields:
+            scrapy.Request: Request re-fetching a page or made to the next
+            drama
+            dict: Information about the drama
+        """
+        if errors is not None:
+            self.count_errors(errors)
+            main_tab_data["field_errors"].update(errors)
+        if self.cast_cache and not set(errors or ()) & set(cast_members):
+            self.cast_store.set(main_tab_data["mydramalist_url"], cast_members)
+        main_tab_data.update(cast_members)
+
+        yield from self.finish_item(main_tab_data, response.meta)
+
+    def refetch_request(self, data, meta):
+        """
+        Building the request re-fetching the page of a field that could not
+        be extracted (the drama's page first, then its cast tab), as long as
+        the page has been fetched less than FIELD_REFETCH_TIMES times again
+
+        Args:
+            data (dict): Information about the drama, with its field errors
+            meta (dict): meta of the request made to the last page scraped
+
+        Returns:
+            scrapy.Request: Request re-fetching a page. Equals to None if
+            there is nothing to re-fetch.
+        """
+        errors = data.get("field_errors")
+        nb_refetches = meta.get("nb_refetches", 0)
+        if not errors or \
+                nb_refetches >= self.settings.getint("FIELD_REFETCH_TIMES", 1):
+            return None
+        url = data["mydramalist_url"]
+        if set(errors) & set(self.CAST_EXTRACTORS) and \
+                not set(errors) - set(self.CAST_EXTRACTORS):
+            url += "/cast"
+        self.crawler.stats.inc_value("tolerant/refetched")
+
+        return self.staged_request(url, self.parse_refetch, data, meta,
+                                   dont_filter=True,
+                                   nb_refetches=nb_refetches + 1)
+
+    def parse_refetch(self, response):
+        """
+        Callback method extracting again the fields of a re-fetched page that
+        could not be extracted the previous time
+
+        Args:
+            response (scrapy.Request): Response from a scrapy.Request
+            made to a drama's page or to its cast tab
+
+        Yields:
+            scrapy.Request: Request re-fetching a page of a field that still
+            could not be extracted
+            dict: Information about the drama
+        """
+        data = self.get_staged_data(response)
+        if data is None:
+            yield self.request_again(response.meta)
+            return
+        errors = data["field_errors"]
+        if response.url.endswith("/cast"):
+            extractors = self.CAST_EXTRACTORS
+        else:
+            extractors = dict(self.MAIN_TAB_EXTRACTORS)
+            extractors.update(
+                (field, None) for field, _ in self.DETAILS_PARSERS.values())
+        failed = [field for field in errors if field in extractors]
+        for field in failed:
+            del errors[field]
+        previous_errors = set(errors)
+        document = self.document(response)
+        if any(extractors[field] is None for field in failed):
+            details = self.get_details(document, errors)
+        for field in failed:
+            if extractors[field] is None:
+                data[field] = details[field]
+            else:
+                data[field] = self.extract_field(
+                    field, getattr(self, extractors[field]), document, errors)
+            if field not in errors:
+                self.crawler.stats.inc_value("tolerant/recovered")
+        self.count_errors(
+            [field for field in errors if field not in previous_errors])
+
+        yield from self.finish_item(data, response.meta)
+
+    def finish_item(self, data, meta):
+        """
+        Re-fetching the page of a field that could not be extracted if any,
+        completing the item otherwise
+
+        Args:
+            data (dict): Information about the drama
+            meta (dict): meta of the request made to the last page scraped
+
+        Yields:
+            scrapy.Request: Request re-fetching a page or made to the next
+            drama released or url claimed from the shared frontier
+            dict: Information about the drama
+        """
+        request = self.refetch_request(data, meta)
+        if request is not None:
+            yield request
+            return
+        yield self.complete_item(data, meta.get("entry"))
+        yield from self.drama_finished(meta.get("entry"))
+        yield from self.acknowledge(meta)
+
+    def complete_item(self, data, entry):
+        """
+        Method called once all the information of a given drama has been
+        retrieved. In incremental mode, the drama is stored in the index, and
+        it is recorded as done in the checkpoint, or as scraped when the
+        dramas are seeded. In tolerant mode, the errors of the fields that
+        could not be extracted are kept in 'field_errors'.
+
+        Args:
+            data (dict): Information about the drama
+            entry (tuple): url and fingerprint of the drama's entry on the
+            top shows
+
+        Returns:
+            dict: Information about the drama
+        """
+        if "field_errors" in data:
+            # Keeping the errors as last field
+            data["field_errors"] = data.pop("field_errors")
+            if data["field_errors"]:
+                self.crawler.stats.inc_value("tolerant/partial_items")
+        # A partial item is not indexed, so that the drama is scraped again
+        # by the next incremental crawl
+        if self.incremental and not data.get("field_errors"):
+            url, entry_fingerprint = entry
+            self.index.update(url, entry_fingerprint, data)
+        if self.checkpoint:
+            self.checkpoint_store.drama_done(entry[0])
+        if self.seed and self.scraped is not None and \
+                not data.get("field_errors"):
+            self.scraped.add(seeds.get_drama_id(entry[0]))
+
+        return data
+
+    def closed(self, reason):
+        """
+        Method called when the spider is closed
+
+        Args:
+            reason (str): reason why the spider was closed
+        """
+        # The stores are opened by start_requests, which may have failed (or
+        # not run at all) before opening all of them
+        try:
+            for name in ("index", "cast_store", "frontier_store", "seen",
+                         "scraped"):
+                store = getattr(self, name, None)
+                if store is not None:
+                    store.close()
+            checkpoint_store = getattr(self, "checkpoint_store", None)
+            if checkpoint_store is not None:
+                checkpoint_store.close(finished=reason == "finished")
+            staging = getattr(self, "staging", None)
+            if staging is not None:
+                staging.close(persist=reason != "finished")
+        finally:
+            if self.parse_pool is not None:
+                self.parse_pool.shutdown()
 
-        yield main_tab_data
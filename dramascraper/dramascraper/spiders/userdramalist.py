@@ -1,52 +1,215 @@
 import sys
+from collections import deque
 
 import scrapy
-from fake_useragent import UserAgent
+from scrapy import signals
+
+from dramascraper import markup, seeds
 
 
 class UserdramalistSpider(scrapy.Spider):
     name = 'userdramalist'
+    STATUSES = [
+        "watching", "completed", "on_hold", "dropped", "plan_to_watch"
+    ]
+    # Backend building the documents of the responses (see markup.document),
+    # set from the PARSER_BACKEND setting
+    parser_backend = "parsel"
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.headers = self.generate_user_agent()
         self.users = self.retrieve_user_arguments(**kwargs)
+        self.statuses = self.retrieve_status_arguments(**kwargs)
+        # Urls of the lists that are still to be requested, for each user
+        # whose lists are being scraped
+        self.pending = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_error,
+                                signal=signals.spider_error)
+        spider.parser_backend = crawler.settings.get("PARSER_BACKEND",
+                                                     "parsel")
+        if spider.parser_backend not in markup.BACKENDS:
+            raise ValueError("Unknown PARSER_BACKEND: " +
+                             spider.parser_backend)
+
+        return spider
 
-    def generate_user_agent(self):
-        ua = UserAgent()
-        user_agent = ua.chrome
-        return {"user-agent": user_agent}
-    
     def retrieve_user_arguments(self, **kwargs):
+        """
+        Retrieving the users whose lists are scraped, either from the
+        comma-separated 'users' argument or from the file given by the
+        'users_file' argument (one user per line, '-' for the standard input)
+
+        Returns:
+            iterable: usernames. The file is read lazily, as the requests are
+            sent.
+        """
         if "users" in kwargs:
             users = kwargs.get("users").split(",")
             users = [user.strip() for user in users]
+        elif "users_file" in kwargs:
+            users = seeds.read_lines(kwargs.get("users_file"))
         else:
-            sys.exit("No argument provided for the 'user' argument")
+            sys.exit("No argument provided for the 'users' or 'users_file' "
+                     "argument")
         return users
 
+    def retrieve_status_arguments(self, **kwargs):
+        """
+        Retrieving the lists that are scraped for each user from the
+        comma-separated 'statuses' argument (every list by default)
+
+        Returns:
+            list: statuses of the lists
+        """
+        if "statuses" not in kwargs:
+            return self.STATUSES
+        statuses = [status.strip() for status in kwargs["statuses"].split(",")]
+        unknown = set(statuses) - set(self.STATUSES)
+        if unknown:
+            sys.exit("Unknown statuses: {}".format(", ".join(sorted(unknown))))
+        return statuses
+
     def start_requests(self):
-        base_url = "https://mydramalist.com/dramalist/{}/completed"
+        """
+        Requesting the lists of each user. At most USER_CONCURRENCY lists of
+        a given user are requested at the same time, the following ones being
+        requested once the previous ones are scraped.
+
+        Yields:
+            scrapy.Request: Request made to a list of a user
+        """
+        base_url = "https://mydramalist.com/dramalist/{}/{}"
+        concurrency = self.settings.getint("USER_CONCURRENCY", 2)
         for user in self.users:
-            url = base_url.format(user)
-            yield scrapy.Request(
-                url, callback=self.parse, meta={"user": user}, headers=self.headers)
-        
+            self.pending[user] = deque(
+                (base_url.format(user, status), status)
+                for status in self.statuses
+            )
+            for _ in range(concurrency):
+                request = self.next_list_request(user)
+                if request is None:
+                    break
+                yield request
+
+    def list_request(self, url, user, status):
+        """
+        Building the request to a page of a list of a user
+
+        Args:
+            url (str): url of the page
+            user (str): username
+            status (str): status of the list
+
+        Returns:
+            scrapy.Request: Request made to the page
+        """
+        return scrapy.Request(
+            url, callback=self.parse, errback=self.list_failed,
+            meta={"user": user, "status": status})
+
+    def next_list_request(self, user):
+        """
+        Building the request to the next list of a user that has not been
+        requested yet
+
+        Args:
+            user (str): username
+
+        Returns:
+            scrapy.Request: Request made to the list. Equals to None if every
+            list of the user has been requested.
+        """
+        pending = self.pending.get(user)
+        if not pending:
+            self.pending.pop(user, None)
+            return None
+        url, status = pending.popleft()
+
+        return self.list_request(url, user, status)
+
+    def list_failed(self, failure):
+        """
+        Errback of the requests made to the lists, which requests the next
+        list of the user
+
+        Args:
+            failure (twisted.python.failure.Failure): failure of the request
+
+        Yields:
+            scrapy.Request: Request made to the next list of the user
+        """
+        request = self.next_list_request(failure.request.meta["user"])
+        if request is not None:
+            yield request
+
+    def spider_error(self, failure, response, spider):
+        """
+        Method called when a callback raised an exception (e.g. a score that
+        is not a number), which requests the next list of the user as the
+        rest of the list is lost
+
+        Args:
+            failure (twisted.python.failure.Failure): exception raised
+            response (scrapy.http.response): Response given to the callback
+            spider (scrapy.Spider): spider
+        """
+        user = response.meta.get("user")
+        if user is None:
+            return
+        request = self.next_list_request(user)
+        if request is None:
+            return
+        try:
+            self.crawler.engine.crawl(request)
+        except TypeError:
+            # Versions of Scrapy older than 2.6 require the spider
+            self.crawler.engine.crawl(request, self)
+
     def parse(self, response):
-        rows = response.css("tbody > tr")
+        user = response.meta["user"]
+        status = response.meta["status"]
+        document = markup.document(response, self.parser_backend)
+        rows = markup.getall("rows", document)
         for row in rows:
             data = {
                 "title": self.get_title(row),
+                "mydramalist_id": self.get_mydramalist_id(row),
                 "score": self.get_score(row),
-                "user": response.meta["user"]
+                "user": user,
+                "status": status
             }
             yield data
 
+        next_page = markup.get("next_page", document)
+        if next_page is not None:
+            yield self.list_request(response.urljoin(next_page), user, status)
+        else:
+            request = self.next_list_request(user)
+            if request is not None:
+                yield request
+
     def get_title(self, selector):
-        return selector.css(".title.text-primary span::text").get()
+        return markup.get("title", selector)
+
+    def get_mydramalist_id(self, selector):
+        # Numeric id of the drama, from the link of its title
+        url = markup.get("title_url", selector)
+        if url is None:
+            return None
+        match = markup.PATTERNS["drama_id"].search(url)
+        if match is None:
+            return None
+
+        return int(match.group(1))
 
     def get_score(self, selector):
-        score = selector.css(".score::text").get()
+        score = markup.get("score", selector)
+        if score is None:
+            return None
         score = int(float(score))
 
         return score
@@ -0,0 +1,419 @@
+"""
+Local on-disk stores used by the spiders to avoid requesting again the pages
+that did not change since the previous crawls, to hold the items being built,
+to remember the ids already seen and to join the records of the dramas to the
+lists of the users.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+
+
+def fingerprint(texts):
+    """
+    Computing a hash of the texts displayed for a drama. Whitespaces are
+    normalized so that only a change of the content alters the hash.
+
+    Args:
+        texts (list): list of texts
+
+    Returns:
+        str: hexadecimal SHA-1 digest
+    """
+    content = " ".join(" ".join(texts).split())
+
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class DramaIndex:
+    """
+    Index of the dramas already scraped, stored in a SQLite file and keyed by
+    their url on MyDramaList. For each drama, it stores the fingerprint of
+    its entry on the pages of the top shows and the last seen ranking,
+    number of watchers and rating.
+    """
+    # Number of updates after which they are saved in the file
+    COMMIT_EVERY = 100
+
+    def __init__(self, path):
+        self.nb_pending = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS drama_index ("
+            "mydramalist_url TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, "
+            "ranking INTEGER, nb_watchers INTEGER, ratings REAL, "
+            "last_seen REAL NOT NULL)"
+        )
+        # The fingerprints are kept in memory to check each drama without
+        # querying the file
+        rows = self.connection.execute(
+            "SELECT mydramalist_url, fingerprint FROM drama_index"
+        )
+        self.fingerprints = dict(rows)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def is_unchanged(self, url, fingerprint):
+        """
+        Checking whether a drama was already scraped with the same entry on
+        the pages of the top shows
+
+        Args:
+            url (str): url of the drama on MyDramaList
+            fingerprint (str): fingerprint of its entry
+
+        Returns:
+            bool: True if the drama does not have to be scraped again
+        """
+        return self.fingerprints.get(url) == fingerprint
+
+    def update(self, url, fingerprint, item):
+        """
+        Storing the fingerprint of a drama once it has been scraped
+
+        Args:
+            url (str): url of the drama on MyDramaList
+            fingerprint (str): fingerprint of its entry
+            item (dict): item returned by the spider for this drama
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO drama_index VALUES (?, ?, ?, ?, ?, ?)",
+            (url, fingerprint, item.get("ranking"), item.get("nb_watchers"),
+             item.get("ratings"), time.time())
+        )
+        self.fingerprints[url] = fingerprint
+        self.nb_pending += 1
+        if self.nb_pending >= self.COMMIT_EVERY:
+            self.connection.commit()
+            self.nb_pending = 0
+
+    def close(self):
+        """
+        Saving the updates and closing the file
+        """
+        self.connection.commit()
+        self.connection.close()
+
+
+class CastCache:
+    """
+    Cache of the cast members of the dramas, stored in a SQLite file and
+    keyed by the url of the drama on MyDramaList. An entry is considered as
+    fresh during 'ttl' seconds after it has been stored.
+    """
+    # Number of updates after which they are saved in the file
+    COMMIT_EVERY = 100
+
+    def __init__(self, path, ttl):
+        self.ttl = ttl
+        self.nb_pending = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cast_cache ("
+            "mydramalist_url TEXT PRIMARY KEY, cast_members TEXT NOT NULL, "
+            "stored_at REAL NOT NULL)"
+        )
+
+    def get(self, url):
+        """
+        Retrieving the cast members of a drama if they are still fresh
+
+        Args:
+            url (str): url of the drama on MyDramaList
+
+        Returns:
+            dict: Cast members keyed by field name. Equals to None if the
+            drama is not cached or if its entry expired.
+        """
+        row = self.connection.execute(
+            "SELECT cast_members FROM cast_cache "
+            "WHERE mydramalist_url = ? AND stored_at >= ?",
+            (url, time.time() - self.ttl)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def set(self, url, cast_members):
+        """
+        Storing the cast members of a drama
+
+        Args:
+            url (str): url of the drama on MyDramaList
+            cast_members (dict): Cast members keyed by field name
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO cast_cache VALUES (?, ?, ?)",
+            (url, json.dumps(cast_members), time.time())
+        )
+        self.nb_pending += 1
+        if self.nb_pending >= self.COMMIT_EVERY:
+            self.connection.commit()
+            self.nb_pending = 0
+
+    def close(self):
+        """
+        Saving the updates and closing the file
+        """
+        self.connection.commit()
+        self.connection.close()
+
+
+class StagingStore:
+    """
+    Store of the items being built (e.g. a drama waiting for its cast
+    members), keyed by the url of the drama, so that only the key travels in
+    the requests. The last 'max_in_memory' items are kept in memory and the
+    older ones are spilled to a SQLite file, so that the memory used does not
+    depend on the number of pending requests.
+
+    The file is temporary unless a path is given. In that case, the items
+    still in memory are also written in the file when the store is closed
+    before the end of the crawl, so that a crawl resumed from a JOBDIR finds
+    them.
+    """
+
+    def __init__(self, max_in_memory=1000, path=None):
+        self.max_in_memory = max_in_memory
+        self.items = OrderedDict()
+        self.temporary = path is None
+        if self.temporary:
+            fd, path = tempfile.mkstemp(prefix="staging-", suffix=".sqlite3")
+            os.close(fd)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS staging ("
+            "key TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self.nb_spilled = self.connection.execute(
+            "SELECT COUNT(*) FROM staging").fetchone()[0]
+
+    def __len__(self):
+        return len(self.items) + self.nb_spilled
+
+    def spill(self, key, data):
+        """
+        Writing an item in the file
+
+        Args:
+            key (str): url of the drama
+            data (dict): item being built
+        """
+        self.connection.execute(
+            "INSERT INTO staging VALUES (?, ?)", (key, json.dumps(data)))
+        self.nb_spilled += 1
+
+    def delete_spilled(self, key):
+        """
+        Deleting an item from the file
+
+        Args:
+            key (str): url of the drama
+
+        Returns:
+            dict: item being built. Equals to None if it is not in the file.
+        """
+        if not self.nb_spilled:
+            return None
+        row = self.connection.execute(
+            "SELECT data FROM staging WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.connection.execute("DELETE FROM staging WHERE key = ?", (key,))
+        self.nb_spilled -= 1
+
+        return json.loads(row[0])
+
+    def put(self, key, data):
+        """
+        Storing an item being built, the oldest item kept in memory being
+        spilled to the file if there are too many of them
+
+        Args:
+            key (str): url of the drama
+            data (dict): item being built (values serializable in JSON)
+        """
+        if key not in self.items:
+            self.delete_spilled(key)
+        self.items[key] = data
+        self.items.move_to_end(key)
+        if len(self.items) > self.max_in_memory:
+            self.spill(*self.items.popitem(last=False))
+
+    def pop(self, key):
+        """
+        Removing an item from the store
+
+        Args:
+            key (str): url of the drama
+
+        Returns:
+            dict: item being built. Equals to None if it is not stored.
+        """
+        data = self.items.pop(key, None)
+        if data is not None:
+            return data
+
+        return self.delete_spilled(key)
+
+    def close(self, persist=False):
+        """
+        Closing the store
+
+        Args:
+            persist (bool): True to write the items still in memory in the
+            file (if it is not temporary), e.g. when the crawl is interrupted.
+            The file is emptied otherwise.
+        """
+        if persist and not self.temporary:
+            while self.items:
+                self.spill(*self.items.popitem(last=False))
+        elif not self.temporary:
+            self.connection.execute("DELETE FROM staging")
+        self.connection.commit()
+        self.connection.close()
+        if self.temporary:
+            os.remove(self.path)
+
+
+class SeenIds:
+    """
+    Set of integer ids (e.g. of the dramas already seeded), stored in a
+    SQLite file rather than in memory. The ids are the rowids of the table,
+    so that millions of them take a few megabytes.
+
+    The file is temporary unless a path is given, in which case the ids seen
+    by a previous crawl are kept.
+    """
+    # Number of ids added after which they are saved in the file
+    COMMIT_EVERY = 1000
+
+    def __init__(self, path=None):
+        self.nb_pending = 0
+        self.temporary = path is None
+        if self.temporary:
+            fd, path = tempfile.mkstemp(prefix="seen-", suffix=".sqlite3")
+            os.close(fd)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS seen (id INTEGER PRIMARY KEY)")
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def __contains__(self, value):
+        return self.connection.execute(
+            "SELECT 1 FROM seen WHERE id = ?", (value,)).fetchone() is not None
+
+    def add(self, value):
+        """
+        Adding an id to the set
+
+        Args:
+            value (int): id
+
+        Returns:
+            bool: True if the id was not in the set yet
+        """
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO seen VALUES (?)", (value,))
+        if not cursor.rowcount:
+            return False
+        self.nb_pending += 1
+        if self.nb_pending >= self.COMMIT_EVERY:
+            self.connection.commit()
+            self.nb_pending = 0
+
+        return True
+
+    def close(self):
+        """
+        Saving the ids and closing the file (removed if it is temporary)
+        """
+        self.connection.commit()
+        self.connection.close()
+        if self.temporary:
+            os.remove(self.path)
+
+
+class DramaRecords:
+    """
+    Records of the dramas scraped, stored in a SQLite file and keyed by their
+    numeric id on MyDramaList. The records looked up the most recently are
+    kept in memory (at most 'cache_size' of them), so that the popular
+    dramas are resolved without querying the file.
+    """
+    # Number of updates after which they are saved in the file
+    COMMIT_EVERY = 100
+
+    def __init__(self, path, cache_size=10000):
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.nb_pending = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS drama_records ("
+            "mydramalist_id INTEGER PRIMARY KEY, record TEXT NOT NULL)"
+        )
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM drama_records").fetchone()[0]
+
+    def get(self, drama_id):
+        """
+        Retrieving the record of a drama
+
+        Args:
+            drama_id (int): id of the drama on MyDramaList
+
+        Returns:
+            dict: record of the drama. Equals to None if it is not stored.
+        """
+        if drama_id in self.cache:
+            self.cache.move_to_end(drama_id)
+            return self.cache[drama_id]
+        row = self.connection.execute(
+            "SELECT record FROM drama_records WHERE mydramalist_id = ?",
+            (drama_id,)
+        ).fetchone()
+        record = json.loads(row[0]) if row is not None else None
+        self.cache[drama_id] = record
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return record
+
+    def set(self, drama_id, record):
+        """
+        Storing the record of a drama
+
+        Args:
+            drama_id (int): id of the drama on MyDramaList
+            record (dict): record of the drama
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO drama_records VALUES (?, ?)",
+            (drama_id, json.dumps(record))
+        )
+        self.cache.pop(drama_id, None)
+        self.nb_pending += 1
+        if self.nb_pending >= self.COMMIT_EVERY:
+            self.connection.commit()
+            self.nb_pending = 0
+
+    def close(self):
+        """
+        Saving the updates and closing the file
+        """
+        self.connection.commit()
+        self.connection.close()